@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class AuthenticatorConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'authenticator'
+
+    def ready(self):
+        from authenticator import signals  # noqa: F401
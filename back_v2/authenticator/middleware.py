@@ -1,21 +1,53 @@
-import jwt
 from django.contrib.auth.models import AnonymousUser
 from django.conf import settings
+from django.core.cache import cache
 from channels.middleware import BaseMiddleware
 from channels.db import database_sync_to_async
 from urllib.parse import parse_qs
 from django.contrib.auth import get_user_model
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
 
 User = get_user_model()
 
+# В кэше только то, что нужно консьюмеру, без хэша пароля; остальные поля
+# экземпляр догрузит из базы, как после .only(). Порядок — как в модели,
+# так значения ждёт from_db
+PROFILE_FIELDS = ('id', 'username', 'is_active', 'nickname')
+
+
+def profile_key(user_id):
+    return f"ws:user:{user_id}"
+
+
+def invalidate_profile(user_id):
+    cache.delete(profile_key(user_id))
+
+
 @database_sync_to_async
-def get_user_from_jwt(token):
+def load_profile(user_id):
+    values = User.objects.filter(id=user_id).values_list(*PROFILE_FIELDS).first()
+    return list(values) if values else None
+
+
+async def get_user_from_jwt(token):
+    # Подпись, срок и тип токена проверяются один раз здесь; пользователя при
+    # переподключениях к началу раунда отдаёт кэш (Redis), а не база
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-        user_id = payload.get("user_id")
-        return User.objects.get(id=user_id)
-    except (jwt.InvalidTokenError, User.DoesNotExist, KeyError):
+        user_id = AccessToken(token)[api_settings.USER_ID_CLAIM]
+    except (TokenError, KeyError):
         return AnonymousUser()
+    key = profile_key(user_id)
+    values = await cache.aget(key)
+    if values is None:
+        values = await load_profile(user_id)
+        if values is None:
+            return AnonymousUser()
+        await cache.aset(key, values, settings.WS_USER_CACHE_TTL)
+    user = User.from_db('default', PROFILE_FIELDS, values)
+    return user if user.is_active else AnonymousUser()
+
 
 class JWTAuthMiddleware(BaseMiddleware):
     async def __call__(self, scope, receive, send):
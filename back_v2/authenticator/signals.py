@@ -0,0 +1,29 @@
+import logging
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from authenticator.middleware import invalidate_profile
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+
+def forget_profile(user_id):
+    # Без Redis профиль в кэше просто доживёт до WS_USER_CACHE_TTL; регистрация
+    # и правка пользователя из-за этого падать не должны
+    try:
+        invalidate_profile(user_id)
+    except Exception as e:
+        logger.warning(f"Cannot invalidate cached profile of user {user_id}: {e}")
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_profile(sender, instance, **kwargs):
+    # После коммита: иначе параллельное подключение закэширует профиль до изменения
+    user_id = instance.pk
+    transaction.on_commit(lambda: forget_profile(user_id))
@@ -1,10 +1,19 @@
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import AnonymousUser
+from django.conf import settings
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from rest_framework.test import APITestCase
 from rest_framework import status
 from django.contrib.auth import get_user_model
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from authenticator.middleware import JWTAuthMiddleware
 
 User = get_user_model()
 
+
 class AuthTests(APITestCase):
     def setUp(self):
         self.register_url = reverse('register')
@@ -73,3 +82,58 @@ class AuthTests(APITestCase):
         self.client.credentials(HTTP_AUTHORIZATION='Bearer invalidtoken')
         response = self.client.post(self.logout_url, {"refresh": "doesnt_matter"})
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@override_settings(CACHES=settings.LOCAL_CACHES)
+class WebsocketAuthTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='socket', password='x', nickname='Socket')
+        self.refresh = RefreshToken.for_user(self.user)
+
+    def connect(self, token):
+        scopes = []
+
+        async def app(scope, receive, send):
+            scopes.append(scope)
+
+        scope = {'type': 'websocket', 'query_string': f'token={token}'.encode()}
+        async_to_sync(JWTAuthMiddleware(app))(scope, None, None)
+        return scopes[0]['user']
+
+    def test_user_from_token_and_cache(self):
+        token = str(self.refresh.access_token)
+        user = self.connect(token)
+        self.assertEqual((user.id, user.nickname), (self.user.id, 'Socket'))
+        self.assertTrue(user.is_authenticated)
+        with self.assertNumQueries(0):
+            user = self.connect(token)
+        self.assertEqual(user.id, self.user.id)
+
+    def test_profile_change_resets_cache(self):
+        token = str(self.refresh.access_token)
+        self.connect(token)
+        # Кэш сбрасывается после коммита
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.nickname = 'Renamed'
+            self.user.save()
+            self.assertEqual(self.connect(token).nickname, 'Socket')
+        self.assertEqual(self.connect(token).nickname, 'Renamed')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertIsInstance(self.connect(token), AnonymousUser)
+
+    @override_settings(CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://127.0.0.1:1/1'}
+    })
+    def test_users_change_without_cache(self):
+        # Redis недоступен: регистрация и правка пользователя всё равно проходят
+        with self.assertLogs('authenticator.signals', 'WARNING'), self.captureOnCommitCallbacks(execute=True):
+            user = User.objects.create_user(username='offline', password='x', nickname='Offline')
+            user.delete()
+
+    def test_rejects_bad_tokens(self):
+        # Refresh-токен подписан тем же ключом, но для websocket не годится
+        for token in ('garbage', str(self.refresh)):
+            self.assertIsInstance(self.connect(token), AnonymousUser)
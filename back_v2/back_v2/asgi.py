@@ -1,19 +1,20 @@
 import os
 from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'back_v2.settings')
 
 django_asgi_app = get_asgi_application()
 
+from authenticator.middleware import JWTAuthMiddleware  # noqa: E402 — после настройки Django
+
 def get_websocket_routes():
     from game.routing import websocket_urlpatterns as game_patterns
     return game_patterns
 
 application = ProtocolTypeRouter({
     'http': django_asgi_app,
-    'websocket': AuthMiddlewareStack(
+    'websocket': JWTAuthMiddleware(
         URLRouter(get_websocket_routes())
     ),
-})
\ No newline at end of file
+})
@@ -56,20 +56,54 @@ WSGI_APPLICATION = 'back_v2.wsgi.application'
 
 ASGI_APPLICATION = 'back_v2.asgi.application'
 
+REDIS_HOST = '192.168.0.104'
+REDIS_PORT = 6379
+REDIS_POOL_SIZE = 50  # Соединений на процесс, общих для всех боёв
+REDIS_POOL_TIMEOUT = 5  # Секунд ждать свободное соединение
+REDIS_HEALTH_CHECK_INTERVAL = 30
+
+# Где живёт состояние боя у движка-владельца: game.backends.MemoryStateBackend
+# держит его в памяти и раз в snapshot_interval тиков пишет снимок в Redis,
+# game.backends.RedisStateBackend читает и пишет Redis на каждый тик и ввод
+BATTLE_STATE = {
+    'BACKEND': 'game.backends.MemoryStateBackend',
+    'OPTIONS': {
+        'snapshot_interval': 50,
+    },
+}
+
+BATTLE_MAP_CACHE_SIZE = 32  # Скомпилированных карт в памяти процесса
+BATTLE_TICK_POLICY = 'catch_up'  # Или 'skip': после задержки не догонять пропущенные тики
+BATTLE_INPUT_RATE = 40  # Сообщений ввода в секунду на игрока, автоповтор клавиш ~30
+BATTLE_INPUT_BURST = 20
+BATTLE_SHOT_COOLDOWN = 0.25  # Секунд между выстрелами
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']  # Кому отдавать /metrics/; None — всем
+
 CHANNEL_LAYERS = {
     'default': {
         'BACKEND': 'channels_redis.core.RedisChannelLayer',
         'CONFIG': {
-            "hosts": [('192.168.0.104', 6379)],
+            "hosts": [(REDIS_HOST, REDIS_PORT)],
             "capacity": 10000,
             "expiry": 10,
         },
     },
 }
 
-REDIS_HOST = '192.168.0.104'
-REDIS_PORT = 6379
-
+# Общий кэш процессов (список комнат и т. п.) в отдельной базе Redis
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': f'redis://{REDIS_HOST}:{REDIS_PORT}/1',
+        'KEY_PREFIX': 'back_v2',
+    },
+}
+# Тот же кэш в памяти процесса — для тестов и loadtest --fake-redis, где Redis нет
+LOCAL_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+WS_USER_CACHE_TTL = 60  # Секунд держать профиль пользователя для авторизации websocket
+ROOM_LIST_CACHE_TTL = 5  # Секунд; дольше список не живёт, даже если его никто не сбросил
+ROOM_SWEEP_INTERVAL = 30  # Секунд между чистками истекших комнат в процессах с боями; None — только командой
+ROOM_SWEEP_BATCH = 500  # Комнат за один UPDATE и ключей боёв за один DEL
 
 DATABASES = {
     'default': {
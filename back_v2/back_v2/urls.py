@@ -20,6 +20,9 @@ schema_view = get_schema_view(
             "- **Действия клиента**: `move_up`, `move_down`, `move_left`, `move_right`, `shoot`, `get_stats`\n"
             "- **Сообщения сервера**: `battle_start`, `game_update`, `stats_update`, `game_over`\n"
             "- **Формат**: JSON, например, `{'action': 'move_up'}` для действий, `{'type': 'game_update', 'data': {...}}` для сообщений.\n"
+            "- **Бинарный формат**: msgpack вместо JSON — подпротокол `msgpack` или query-параметр `encoding=msgpack`. "
+            "Танки передаются как `[player_id, x, y, direction, is_alive]`, пули как `[id, shooter_id, x, y, direction]`, "
+            "direction — индекс в `up, down, left, right`.\n"
         ),
         terms_of_service="https://www.example.com/terms/",
         contact=openapi.Contact(email="support@battlecity.com"),
@@ -34,6 +37,7 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/authenticator/', include('authenticator.urls')),
     path('api/rooms/', include('rooms.urls')),
+    path('', include('game.urls')),
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
 ]
\ No newline at end of file
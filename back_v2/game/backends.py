@@ -0,0 +1,193 @@
+import asyncio
+import logging
+
+from game.maps import TILE_SIZE
+from game.metrics import BattleMetrics
+from game.physics import MUZZLE_OFFSET, TANK_SIZE, TANK_SPEED, spawn_tank
+from game.protocol import DIRECTION_CODES
+from game.scripts import MOVE_TANK_SCRIPT, SHOOT_SCRIPT
+from game.simulation import Simulation, bullet_id
+from game.storage import migrate_legacy_state, pack_snapshot, state_key, tiles_key, unpack_snapshot
+
+logger = logging.getLogger(__name__)
+
+
+# Хранилище состояния боя для движка. Бэкенд выбирается BATTLE_STATE_BACKEND;
+# движок вызывает его под своим lock, поэтому вызовы не пересекаются.
+class StateBackend:
+    def __init__(self, battle_id, redis_client, game_map, metrics=None):
+        self.battle_id = battle_id
+        self.redis = redis_client
+        self.game_map = game_map
+        self.metrics = metrics or BattleMetrics()
+        self.state_key = state_key(battle_id)
+        self.tiles_key = tiles_key(battle_id)
+
+    async def read(self):
+        blob = await self.redis.get(self.state_key)
+        if blob:
+            return unpack_snapshot(blob)
+        # Бой, начатый до перехода на снимки
+        return await migrate_legacy_state(self.redis, self.battle_id) or ({}, {})
+
+    async def load(self):
+        pass
+
+    async def flush(self):
+        pass
+
+    async def discard(self):
+        pass
+
+
+# Всё состояние в Redis: каждый ввод и тик читают и пишут снимок
+class RedisStateBackend(StateBackend):
+    def __init__(self, battle_id, redis_client, game_map, metrics=None):
+        super().__init__(battle_id, redis_client, game_map, metrics)
+        # Ввод — один EVALSHA; redis-py сам загрузит скрипт, если его нет в кэше сервера
+        self.move_script = redis_client.register_script(MOVE_TANK_SCRIPT)
+        self.shoot_script = redis_client.register_script(SHOOT_SCRIPT)
+
+    async def create_tank(self, player_id):
+        tanks, bullets = await self.read()
+        if player_id in tanks:
+            return None  # Переподключение или повторный join после выборов
+        tank = spawn_tank(player_id, tanks, self.game_map)
+        tanks[player_id] = tank
+        await self.redis.set(self.state_key, pack_snapshot(tanks, bullets))
+        return tank
+
+    async def remove_tank(self, player_id):
+        tanks, bullets = await self.read()
+        if tanks.pop(player_id, None):
+            await self.redis.set(self.state_key, pack_snapshot(tanks, bullets))
+
+    async def move(self, player_id, direction, steps=1, client=None):
+        game_map = self.game_map
+        await self.move_script(
+            keys=[self.state_key, self.tiles_key],
+            args=[
+                player_id, DIRECTION_CODES[direction], TANK_SPEED, TANK_SIZE // 2,
+                game_map.width, game_map.height, game_map.cols, game_map.rows, TILE_SIZE, steps
+            ],
+            client=client
+        )
+
+    async def shoot(self, player_id, bullet_id, client=None):
+        await self.shoot_script(
+            keys=[self.state_key, self.tiles_key],
+            args=[player_id, bullet_id, MUZZLE_OFFSET],
+            client=client
+        )
+
+    async def apply_inputs(self, batch, now):
+        # Весь ввод тика — скрипты в одном конвейере, один round trip
+        if not batch:
+            return
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for player_id, direction, steps, shoot in batch:
+                if direction:
+                    await self.move(player_id, direction, steps, client=pipe)
+                if shoot:
+                    await self.shoot(player_id, bullet_id(player_id, now), client=pipe)
+            await pipe.execute()
+
+    async def tick(self, now, dt):
+        # Одно чтение и одна запись снимка за тик
+        with self.metrics.phase('read'):
+            tanks, bullets = await self.read()
+        with self.metrics.phase('physics'):
+            simulation = Simulation(self.game_map, tanks, bullets)
+            respawned, _, destroyed_tiles = simulation.step(now, dt)
+
+        if bullets or respawned:
+            with self.metrics.phase('write'):
+                async with self.redis.pipeline() as pipe:
+                    await pipe.set(self.state_key, pack_snapshot(tanks, simulation.bullets))
+                    for index in destroyed_tiles:
+                        await pipe.setrange(self.tiles_key, index, self.game_map.tile_at(index))
+                    await pipe.execute()
+        return tanks, simulation.bullets, destroyed_tiles
+
+
+# Состояние в памяти процесса-владельца; в Redis раз в snapshot_interval тиков
+# уходит снимок, с которого продолжит следующий владелец
+class MemoryStateBackend(StateBackend):
+    def __init__(self, battle_id, redis_client, game_map, snapshot_interval=50, metrics=None):
+        super().__init__(battle_id, redis_client, game_map, metrics)
+        self.snapshot_interval = snapshot_interval
+        self.simulation = Simulation(game_map)
+        self.ticks = 0
+        self.dirty = False
+        self.discarded = False
+        self.saving = None
+
+    async def load(self):
+        tanks, bullets = await self.read()
+        self.simulation = Simulation(self.game_map, tanks, bullets)
+
+    async def create_tank(self, player_id):
+        tank = self.simulation.join(player_id)
+        if tank:
+            self.dirty = True
+        return tank
+
+    async def remove_tank(self, player_id):
+        if self.simulation.leave(player_id):
+            self.dirty = True
+
+    async def move(self, player_id, direction, steps=1):
+        if self.simulation.move(player_id, direction, steps):
+            self.dirty = True
+
+    async def shoot(self, player_id, bullet_id):
+        if self.simulation.shoot(player_id, bullet_id):
+            self.dirty = True
+
+    async def apply_inputs(self, batch, now):
+        if self.simulation.apply_inputs(batch, now):
+            self.dirty = True
+
+    async def tick(self, now, dt):
+        simulation = self.simulation
+        had_bullets = bool(simulation.bullets)
+        with self.metrics.phase('physics'):
+            respawned, _, destroyed_tiles = simulation.step(now, dt)
+        if had_bullets or respawned:
+            self.dirty = True
+
+        self.ticks += 1
+        if self.dirty and self.ticks % self.snapshot_interval == 0:
+            self.schedule_save()
+        # Наружу копии: кадры сравнивают с прошлым тиком, а сущности меняются на месте
+        tanks = {player_id: dict(tank) for player_id, tank in simulation.tanks.items()}
+        bullets = {bullet_id: dict(bullet) for bullet_id, bullet in simulation.bullets.items()}
+        return tanks, bullets, destroyed_tiles
+
+    def schedule_save(self):
+        if self.saving and not self.saving.done():
+            return  # Прошлый снимок ещё пишется, попробуем через интервал
+        self.dirty = False
+        # Упаковываем сразу, чтобы снимок соответствовал этому тику
+        self.saving = asyncio.create_task(self.save(pack_snapshot(self.simulation.tanks, self.simulation.bullets), self.game_map.obstacles))
+
+    async def save(self, blob, tiles):
+        try:
+            async with self.redis.pipeline() as pipe:
+                await pipe.set(self.state_key, blob)
+                await pipe.set(self.tiles_key, tiles)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to save snapshot of battle {self.battle_id}: {e}")
+
+    async def flush(self):
+        if self.saving:
+            await self.saving
+        if not self.discarded:
+            await self.save(pack_snapshot(self.simulation.tanks, self.simulation.bullets), self.game_map.obstacles)
+
+    async def discard(self):
+        # Бой закончен: больше ничего не пишем, чтобы не воскресить удалённые ключи
+        self.discarded = True
+        if self.saving:
+            await self.saving
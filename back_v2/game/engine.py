@@ -0,0 +1,386 @@
+import asyncio
+import logging
+import time
+import uuid
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from rooms.models import Room
+from game.inputs import InputQueue
+from game.interest import InterestGrid
+from game import metrics
+from game.map_cache import compiled_maps
+from game.protocol import DIRECTIONS, FrameEncoder
+from game.redis_pool import get_redis
+from game.scheduler import TickScheduler
+from game import sweeper
+from game.storage import battle_keys, lease_key, state_key, tick_key, tiles_key
+
+logger = logging.getLogger(__name__)
+
+LEASE_TTL_MS = 3000  # Если владелец умер, другой воркер заберёт бой через это время
+LEASE_RENEW_INTERVAL = 1.0
+LEASE_RETRY_INTERVAL = 1.0
+
+RENEW_LEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+RELEASE_LEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# Движки боёв этого процесса, по одному на battle_id
+_engines = {}
+
+
+def engine_group_name(battle_id):
+    return f'battle_{battle_id}_engine'
+
+
+def attach(battle_id):
+    engine = _engines.get(battle_id)
+    # Остановленный движок ещё в словаре, пока не отработал его finally, — нужен новый
+    if engine is None or not engine.running:
+        engine = BattleEngine(battle_id)
+        _engines[battle_id] = engine
+        engine.start()
+        sweeper.start()
+    engine.consumers += 1
+    return engine
+
+
+def detach(battle_id):
+    engine = _engines.get(battle_id)
+    if engine is None:
+        return
+    engine.consumers -= 1
+    if engine.consumers <= 0:
+        engine.stop()
+
+
+def is_running(battle_id):
+    # Движок боя есть в этом процессе, в том числе остановленный, но ещё не
+    # отработавший finally: он сам уберёт метрики боя
+    return battle_id in _engines
+
+
+# Движок есть в каждом процессе, где подключены игроки боя, но тикает только
+# владелец аренды battle:{id}:engine. Остальные ждут и забирают бой, когда
+# аренда истекает.
+class BattleEngine:
+    def __init__(self, battle_id):
+        self.battle_id = battle_id
+        self.room_group_name = f'battle_{battle_id}'
+        self.engine_group_name = engine_group_name(battle_id)
+        self.lease_key = lease_key(battle_id)
+        self.tick_key = tick_key(battle_id)
+        self.tiles_key = tiles_key(battle_id)
+        self.state_key = state_key(battle_id)
+        self.lease_token = uuid.uuid4().hex
+        self.consumers = 0
+        self.running = False
+        self.is_owner = False
+        self.map_changed = True  # Флаг для отправки карты всей группе
+        self.tile_diffs = []
+        self.room = None
+        self.game_map = None
+        self.state = None
+        self.frames = None
+        self.scheduler = None
+        self.pending_keyframes = set()
+        self.players = {}  # player_id -> канал консьюмера
+        self.views = {}  # player_id -> FrameEncoder зоны видимости
+        self.view_tiles = None
+        self.inputs = InputQueue(settings.BATTLE_SHOT_COOLDOWN)
+        self.metrics = metrics.battle(battle_id)
+        self.redis = None
+        self.channel_layer = get_channel_layer()
+        self.channel_name = None
+        self.lock = asyncio.Lock()
+        self.task = None
+        self.input_task = None
+
+    def start(self):
+        self.running = True
+        self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        self.running = False
+        if self.task:
+            self.task.cancel()
+
+    async def run(self):
+        self.redis = get_redis()
+        try:
+            while self.running:
+                if await self.acquire_lease():
+                    await self.drive()
+                else:
+                    await asyncio.sleep(LEASE_RETRY_INTERVAL)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.exception(f"Engine for battle {self.battle_id} crashed: {e}")
+        finally:
+            await self.resign()
+            if _engines.get(self.battle_id) is self:
+                del _engines[self.battle_id]
+                metrics.forget(self.battle_id)
+
+    async def acquire_lease(self):
+        return bool(await self.redis.set(self.lease_key, self.lease_token, nx=True, px=LEASE_TTL_MS))
+
+    async def renew_lease(self):
+        return bool(await self.redis.eval(RENEW_LEASE_SCRIPT, 1, self.lease_key, self.lease_token, LEASE_TTL_MS))
+
+    async def drive(self):
+        self.room = await self.get_room()
+        if not self.room or not self.room.is_active:
+            self.running = False
+            await self.redis.eval(RELEASE_LEASE_SCRIPT, 1, self.lease_key, self.lease_token)
+            return
+
+        self.is_owner = True
+        self.map_changed = True
+        self.players = {}
+        self.views = {}
+        # Зона видимости включается на карте; без неё кадры одни на всю группу
+        self.view_tiles = self.room.map_name.view_tiles
+        # Владелец единственный пишет карту, поэтому держим её скомпилированной в памяти
+        self.game_map = await self.get_map()
+        self.state = self.create_state()
+        await self.state.load()
+        # Номера тиков продолжаются после смены владельца: прежний успел уйти
+        # не дальше, чем на интервал ключевых кадров от сохранённого
+        last_tick = await self.redis.get(self.tick_key)
+        keyframe_interval = self.room.broadcast_rate
+        self.frames = FrameEncoder(self.battle_id, int(last_tick or 0) + keyframe_interval, keyframe_interval)
+        self.channel_name = await self.channel_layer.new_channel()
+        await self.channel_layer.group_add(self.engine_group_name, self.channel_name)
+        self.input_task = asyncio.create_task(self.receive_inputs())
+        # Игроки, подключённые до выборов, повторно сообщают о себе
+        await self.channel_layer.group_send(self.room_group_name, {'type': 'engine_elected'})
+        logger.info(f"Engine for battle {self.battle_id} took ownership")
+
+        scheduler = self.scheduler = TickScheduler(
+            self.room.tick_rate, self.room.broadcast_rate, settings.BATTLE_TICK_POLICY
+        )
+        scheduler.start(time.monotonic())
+        self.metrics.scheduler = scheduler
+        lease_renewed_at = time.time()
+        reported_overruns = 0
+        while self.running:
+            if time.time() - lease_renewed_at >= LEASE_RENEW_INTERVAL:
+                if not await self.renew_lease():
+                    logger.warning(f"Engine for battle {self.battle_id} lost its lease")
+                    break
+                lease_renewed_at = time.time()
+                if scheduler.overruns > reported_overruns:
+                    logger.warning(
+                        f"Battle {self.battle_id} overran {scheduler.overruns - reported_overruns} ticks, "
+                        f"{scheduler.skipped} steps skipped in total"
+                    )
+                    reported_overruns = scheduler.overruns
+
+            if self.room.end_time and timezone.now() >= self.room.end_time:
+                await self.finish()
+                break
+
+            steps, broadcast = scheduler.advance(time.monotonic())
+            if steps:
+                async with self.lock:
+                    for _ in range(steps):
+                        with self.metrics.phase('tick'):
+                            now = time.time()
+                            with self.metrics.phase('inputs'):
+                                await self.state.apply_inputs(self.inputs.drain(now), now)
+                            tanks, bullets = await self.update_bullets(now, scheduler.step)
+                    self.metrics.gauges['tanks'] = len(tanks)
+                    self.metrics.gauges['bullets'] = len(bullets)
+                    if broadcast:
+                        await self.send_game_state(tanks, bullets)
+            await asyncio.sleep(scheduler.delay(time.monotonic()))
+
+        await self.resign()
+
+    def create_state(self):
+        backend = import_string(settings.BATTLE_STATE['BACKEND'])
+        return backend(
+            self.battle_id, self.redis, self.game_map, metrics=self.metrics, **settings.BATTLE_STATE.get('OPTIONS', {})
+        )
+
+    async def resign(self):
+        if not self.is_owner:
+            return
+        self.is_owner = False
+        if self.input_task:
+            self.input_task.cancel()
+            self.input_task = None
+        # Последний снимок пишем, только если бой ещё наш: иначе затрём состояние нового владельца
+        if self.state and await self.renew_lease():
+            await self.state.flush()
+        await self.channel_layer.group_discard(self.engine_group_name, self.channel_name)
+        await self.redis.eval(RELEASE_LEASE_SCRIPT, 1, self.lease_key, self.lease_token)
+
+    async def finish(self):
+        await self.state.discard()
+        await self.set_room_inactive()
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            {'type': 'game_event', 'data': {'event': 'game_over', 'reason': 'time_up'}}
+        )
+        await self.clear_room_state()
+        self.running = False
+
+    async def receive_inputs(self):
+        while True:
+            message = await self.channel_layer.receive(self.channel_name)
+            handler = getattr(self, message['type'], None)
+            if handler is None:
+                logger.warning(f"Unknown engine message in battle {self.battle_id}: {message['type']}")
+                continue
+            try:
+                async with self.lock:
+                    await handler(message)
+            except Exception as e:
+                logger.error(f"Error handling {message['type']} in battle {self.battle_id}: {e}")
+
+    async def player_join(self, message):
+        player_id = message['player_id']
+        try:
+            tank = await self.state.create_tank(player_id)
+        except ValueError as e:
+            logger.error(f"Cannot place tank in battle {self.battle_id}: {e}")
+            await self.channel_layer.send(message['reply_channel'], {'type': 'join_rejected', 'reason': str(e)})
+            return
+        if tank:
+            logger.info(f"Tank created for user {player_id} at x={tank['x']}, y={tank['y']}")
+        self.players[player_id] = message['reply_channel']
+        self.pending_keyframes.add(message['reply_channel'])
+
+    async def player_resync(self, message):
+        self.pending_keyframes.add(message['reply_channel'])
+
+    async def player_leave(self, message):
+        self.players.pop(message['player_id'], None)
+        self.views.pop(message['player_id'], None)
+        self.inputs.forget(message['player_id'])
+        await self.state.remove_tank(message['player_id'])
+
+    async def player_input(self, message):
+        # Применяется на границе тика, см. InputQueue
+        action = message.get('action')
+        if action == 'move' and message.get('direction') in DIRECTIONS:
+            self.inputs.push(message['player_id'], action, message['direction'])
+        elif action == 'shoot':
+            self.inputs.push(message['player_id'], action)
+        else:
+            return
+        self.metrics.count('inputs')
+
+    async def send_game_state(self, tanks, bullets):
+        time_left = (self.room.end_time - timezone.now()).seconds if self.room.end_time > timezone.now() else None
+        # Сначала собираем все кадры тика, потом рассылаем: так в метриках
+        # сборка (encode) и отправка (send) не перемешаны
+        with self.metrics.phase('encode'):
+            frame = self.frames.advance(tanks.values(), bullets.values(), time_left)
+            keyframe_due = self.frames.keyframe_due()
+            if keyframe_due:
+                # Карта целиком уходит группе только после смены владельца
+                map_data = self.game_map.to_data() if self.map_changed else None
+                self.map_changed = False
+                frame = self.frames.keyframe(map_data, rebase=True)
+            if self.view_tiles:
+                outgoing = self.encode_views(tanks, bullets, time_left)
+            else:
+                # None вместо канала — кадр всей группе
+                outgoing = [(None, frame)] if frame else []
+                if self.pending_keyframes:
+                    keyframe = self.frames.keyframe(self.game_map.to_data())
+                    outgoing += [(channel_name, keyframe) for channel_name in self.pending_keyframes]
+            self.pending_keyframes.clear()
+        if keyframe_due:
+            await self.redis.set(self.tick_key, self.frames.tick)
+        try:
+            with self.metrics.phase('send'):
+                if self.tile_diffs:
+                    # Разрушения за тик одним событием; события, в отличие от кадров, не теряются
+                    await self.channel_layer.group_send(
+                        self.room_group_name,
+                        {'type': 'game_event', 'data': {'event': 'tiles', 'tick': self.frames.tick, 'tiles': self.tile_diffs}}
+                    )
+                    self.tile_diffs = []
+                for channel_name, data in outgoing:
+                    if channel_name is None:
+                        await self.channel_layer.group_send(self.room_group_name, {'type': 'game_state', 'data': data})
+                    else:
+                        await self.channel_layer.send(channel_name, {'type': 'game_state', 'data': data})
+        except Exception as e:
+            logger.warning(f"Error in sending game state: {e}")
+
+    def encode_views(self, tanks, bullets, time_left):
+        # Каждому игроку свой поток кадров: только танки и пули в окне view_tiles
+        # клеток вокруг его танка. Ушедшее из окна приходит как удалённое.
+        grid = InterestGrid(tanks, bullets)
+        outgoing = []
+        for player_id, channel_name in self.players.items():
+            tank = tanks.get(player_id)
+            if tank is None:
+                continue
+            view = self.views.get(player_id)
+            resync = view is None or channel_name in self.pending_keyframes
+            if view is None:
+                # Тики зоны видимости совпадают с тиками группы
+                view = FrameEncoder(self.battle_id, self.frames.tick - 1, self.frames.keyframe_interval)
+                self.views[player_id] = view
+            view_tanks, view_bullets = grid.visible(tank['x'], tank['y'], self.view_tiles)
+            frame = view.advance(view_tanks, view_bullets, time_left)
+            if resync or view.keyframe_due():
+                frame = view.keyframe(self.game_map.to_data() if resync else None, rebase=True)
+            if frame:
+                outgoing.append((channel_name, frame))
+        return outgoing
+
+    @database_sync_to_async
+    def get_room(self):
+        try:
+            return Room.objects.select_related("map_name").get(battle_id=self.battle_id)
+        except Room.DoesNotExist:
+            return None
+
+    @database_sync_to_async
+    def set_room_inactive(self):
+        self.room.is_active = False
+        self.room.save()
+
+    async def get_map(self):
+        # Сама карта — из кэша процесса, в Redis лежат только клетки боя, чтобы
+        # разрушения пережили смену владельца
+        compiled = compiled_maps.get(self.room.map_name)
+        tiles = await self.redis.get(self.tiles_key)
+        if tiles is None:
+            # Клетки хранятся отдельной строкой, чтобы разрушение было одним SETRANGE
+            await self.redis.set(self.tiles_key, compiled.obstacles)
+            logger.info(f"Map loaded for battle {self.battle_id}")
+            return compiled.copy()
+        return compiled.copy(tiles.decode())
+
+    async def update_bullets(self, now, dt):
+        tanks, bullets, destroyed_tiles = await self.state.tick(now, dt)
+        for index in destroyed_tiles:
+            self.tile_diffs.append({'index': index, 'tile': self.game_map.tile_at(index)})
+        return tanks, bullets
+
+    async def clear_room_state(self):
+        await self.redis.delete(*battle_keys(self.battle_id))
@@ -0,0 +1,60 @@
+# Ограничение частоты ввода одного игрока: burst сообщений сразу, дальше rate в секунду
+class TokenBucket:
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+        self.dropped = 0
+
+    def take(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            self.dropped += 1
+            return False
+        self.tokens -= 1
+        return True
+
+
+# Ввод копится между тиками и применяется на границе тика: от игрока за тик
+# один ход (последнее направление) и не больше одного выстрела, поэтому работа
+# тика зависит от числа игроков, а не от частоты их сообщений. Ход помнит,
+# сколько сообщений подряд пришло в этом направлении: каждое сдвигает танк на
+# TANK_SPEED, и скорость не зависит от tick_rate комнаты.
+class InputQueue:
+    def __init__(self, shot_cooldown):
+        self.shot_cooldown = shot_cooldown
+        self.last_shot = {}
+        self.moves = {}
+        self.shots = set()
+
+    def push(self, player_id, action, direction=None):
+        if action == 'move':
+            move = self.moves.get(player_id)
+            if move and move[0] == direction:
+                move[1] += 1
+            else:
+                self.moves[player_id] = [direction, 1]
+        elif action == 'shoot':
+            self.shots.add(player_id)
+
+    def drain(self, now):
+        # [(player_id, направление или None, шагов, стреляет ли)]
+        batch = []
+        for player_id in sorted(self.moves.keys() | self.shots):
+            shoot = False
+            if player_id in self.shots and now - self.last_shot.get(player_id, float('-inf')) >= self.shot_cooldown:
+                self.last_shot[player_id] = now
+                shoot = True
+            direction, steps = self.moves.get(player_id, (None, 0))
+            if direction or shoot:
+                batch.append((player_id, direction, steps, shoot))
+        self.moves.clear()
+        self.shots.clear()
+        return batch
+
+    def forget(self, player_id):
+        self.last_shot.pop(player_id, None)
+        self.moves.pop(player_id, None)
+        self.shots.discard(player_id)
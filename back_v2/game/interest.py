@@ -0,0 +1,19 @@
+from game.maps import TILE_SIZE
+from game.spatial import SpatialHash
+
+
+# Зона видимости игрока — окно клеток карты вокруг его танка. Сущности
+# раскладываются по той же сетке клеток, поэтому окно из (2n+1)² клеток
+# собирается из готовых корзин без перебора всех танков и пуль.
+class InterestGrid:
+    def __init__(self, tanks, bullets):
+        self.tanks = SpatialHash(TILE_SIZE)
+        self.bullets = SpatialHash(TILE_SIZE)
+        for player_id, tank in tanks.items():
+            self.tanks.insert(player_id, tank, tank['x'], tank['y'])
+        for bullet_id, bullet in bullets.items():
+            self.bullets.insert(bullet_id, bullet, bullet['x'], bullet['y'])
+
+    def visible(self, x, y, view_tiles):
+        radius = view_tiles * TILE_SIZE
+        return list(self.tanks.around(x, y, radius).values()), list(self.bullets.around(x, y, radius).values())
@@ -0,0 +1,102 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from game.maps import CompiledMap, TILE_SIZE
+from game.physics import np, respawn_tanks, step_bullets
+
+DIRECTIONS = ('up', 'down', 'left', 'right')
+
+
+def open_map(cols, rows):
+    # Пустое поле в рамке из стен, точки спавна по всей карте
+    tiles = []
+    for row in range(rows):
+        for col in range(cols):
+            if row in (0, rows - 1) or col in (0, cols - 1):
+                tiles.append('W')
+            elif row % 4 == 2 and col % 4 == 2:
+                tiles.append('S')
+            else:
+                tiles.append(' ')
+    return CompiledMap('bench', cols * TILE_SIZE, rows * TILE_SIZE, ''.join(tiles))
+
+
+def random_bullet(bullet_id, game_map, rng):
+    return {
+        'id': bullet_id,
+        'shooter_id': 0,
+        'x': rng.uniform(TILE_SIZE, game_map.width - TILE_SIZE),
+        'y': rng.uniform(TILE_SIZE, game_map.height - TILE_SIZE),
+        'direction': rng.choice(DIRECTIONS)
+    }
+
+
+class Command(BaseCommand):
+    help = "Benchmark bullet-vs-tank collision: full scan vs spatial hash vs NumPy vs automatic choice"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tanks', type=int, nargs='+', default=[16, 64, 256])
+        parser.add_argument('--bullets', type=int, default=2000)
+        parser.add_argument('--ticks', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'tanks':>6} {'bullets':>8} {'scan t/s':>10} {'hash t/s':>10} {'speedup':>8} {'numpy t/s':>10} "
+            f"{'auto t/s':>10}"
+        )
+        for tank_count in options['tanks']:
+            scan = self.run(tank_count, options['bullets'], options['ticks'], options['seed'], spatial=False)
+            spatial = self.run(tank_count, options['bullets'], options['ticks'], options['seed'], spatial=True)
+            if np is not None:
+                vectorized = self.run(
+                    tank_count, options['bullets'], options['ticks'], options['seed'], spatial=True, vectorized=True
+                )
+                vectorized = f"{vectorized:>10.1f}"
+            else:
+                vectorized = f"{'-':>10}"
+            # Путь, который step_bullets выбирает сам, как в бою
+            auto = self.run(
+                tank_count, options['bullets'], options['ticks'], options['seed'], spatial=True, vectorized=None
+            )
+            self.stdout.write(
+                f"{tank_count:>6} {options['bullets']:>8} {scan:>10.1f} {spatial:>10.1f} {spatial / scan:>7.1f}x "
+                f"{vectorized} {auto:>10.1f}"
+            )
+
+    def run(self, tank_count, bullet_count, ticks, seed, spatial, vectorized=False):
+        rng = random.Random(seed)
+        random.seed(seed)
+        side = max(12, int((tank_count * 16) ** 0.5))
+        game_map = open_map(side, side)
+        tanks = {}
+        for player_id in range(tank_count):
+            tanks[player_id] = {
+                'player_id': player_id,
+                'x': rng.uniform(TILE_SIZE, game_map.width - TILE_SIZE),
+                'y': rng.uniform(TILE_SIZE, game_map.height - TILE_SIZE),
+                'direction': rng.choice(DIRECTIONS),
+                'is_alive': True
+            }
+        bullets = {}
+        next_id = 0
+        now = 0.0
+        elapsed = 0.0
+        for _ in range(ticks):
+            # Постоянный огонь: добираем пули до заданного количества
+            while len(bullets) < bullet_count:
+                bullets[next_id] = random_bullet(next_id, game_map, rng)
+                next_id += 1
+            start = time.perf_counter()
+            respawn_tanks(tanks, game_map, now)
+            bullets, _, hit_tanks, _ = step_bullets(
+                bullets, tanks, game_map, now, 0.01, spatial=spatial, vectorized=vectorized
+            )
+            elapsed += time.perf_counter() - start
+            # Подбитые танки сразу возвращаем, чтобы плотность целей не падала
+            for tank_id in hit_tanks:
+                tanks[tank_id]['is_alive'] = True
+            now += 0.01
+        return ticks / elapsed
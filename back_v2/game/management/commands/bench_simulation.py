@@ -0,0 +1,107 @@
+import random
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from game.inputs import InputQueue
+from game.maps import CompiledMap, TILE_SIZE
+from game.protocol import DIRECTIONS
+from game.simulation import Simulation
+
+
+def arena(cols, rows):
+    # Поле в рамке из стен с кирпичами; появиться можно на любой свободной клетке
+    tiles = []
+    for row in range(rows):
+        for col in range(cols):
+            if row in (0, rows - 1) or col in (0, cols - 1):
+                tiles.append('W')
+            elif row % 3 == 0 and col % 3 == 0:
+                tiles.append('B')
+            else:
+                tiles.append('S')
+    return CompiledMap('bench', cols * TILE_SIZE, rows * TILE_SIZE, ''.join(tiles))
+
+
+def parse_size(value):
+    cols, rows = value.split('x')
+    return int(cols), int(rows)
+
+
+class Command(BaseCommand):
+    help = "Benchmark the battle simulation alone: ticks/sec and allocations per tick under sustained fire"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tanks', type=int, nargs='+', default=[2, 16, 64])
+        # Размеры в клетках: 12x9 — карта клиента 768x576
+        parser.add_argument('--maps', type=parse_size, nargs='+', default=[(12, 9), (24, 18)])
+        parser.add_argument('--tick-rate', type=int, default=100)
+        parser.add_argument('--ticks', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'map':>7} {'tanks':>6} {'bullets':>8} {'ticks/s':>9} {'us/tick':>8} "
+            f"{'peak KiB/tick':>14} {'kept B/tick':>12}"
+        )
+        for cols, rows in options['maps']:
+            for tank_count in options['tanks']:
+                size = f"{cols}x{rows}"
+                if tank_count > len(arena(cols, rows).spawn_points):
+                    self.stdout.write(f"{size:>7} {tank_count:>6}  does not fit")
+                    continue
+                rate, bullets = self.run(cols, rows, tank_count, options, trace=False)
+                peak, kept = self.run(cols, rows, tank_count, options, trace=True)
+                self.stdout.write(
+                    f"{size:>7} {tank_count:>6} {bullets:>8.0f} {rate:>9.0f} {1e6 / rate:>8.1f} "
+                    f"{peak:>14.1f} {kept:>12.1f}"
+                )
+
+    def run(self, cols, rows, tank_count, options, trace):
+        # Сценарий повторяется от запуска к запуску: каждый танк едет, иногда
+        # поворачивает и стреляет, как только позволяет перезарядка
+        random.seed(options['seed'])
+        rng = random.Random(options['seed'])
+        simulation = Simulation(arena(cols, rows))
+        for player_id in range(tank_count):
+            simulation.join(player_id)
+        inputs = InputQueue(settings.BATTLE_SHOT_COOLDOWN)
+        headings = {player_id: rng.choice(DIRECTIONS) for player_id in range(tank_count)}
+        dt = 1.0 / options['tick_rate']
+        now = 0.0
+        elapsed = 0.0
+        bullet_total = 0
+        peak_total = 0
+        kept_total = 0
+
+        if trace:
+            tracemalloc.start()
+        for _ in range(options['ticks']):
+            for player_id in range(tank_count):
+                if rng.random() < 0.05:
+                    headings[player_id] = rng.choice(DIRECTIONS)
+                inputs.push(player_id, 'move', headings[player_id])
+                inputs.push(player_id, 'shoot')
+            batch = inputs.drain(now)
+
+            if trace:
+                # Пик — сколько тик выделяет по ходу, разница — сколько остаётся после него
+                tracemalloc.reset_peak()
+                current, _ = tracemalloc.get_traced_memory()
+            start = time.perf_counter()
+            simulation.apply_inputs(batch, now)
+            simulation.step(now, dt)
+            elapsed += time.perf_counter() - start
+            if trace:
+                after, peak = tracemalloc.get_traced_memory()
+                peak_total += peak - current
+                kept_total += after - current
+
+            bullet_total += len(simulation.bullets)
+            now += dt
+        if trace:
+            tracemalloc.stop()
+            return peak_total / options['ticks'] / 1024, kept_total / options['ticks']
+        return options['ticks'] / elapsed, bullet_total / options['ticks']
@@ -0,0 +1,82 @@
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from game.protocol import DIRECTIONS
+from game.storage import pack_snapshot, unpack_snapshot
+
+
+def make_state(tank_count, bullet_count, rng):
+    tanks = {
+        player_id: {
+            'player_id': player_id,
+            'x': rng.randint(0, 800),
+            'y': rng.randint(0, 600),
+            'direction': rng.choice(DIRECTIONS),
+            'is_alive': True
+        }
+        for player_id in range(tank_count)
+    }
+    bullets = {}
+    for i in range(bullet_count):
+        bullet_id = f"{i % max(tank_count, 1)}:{1700000000000 + i}"
+        bullets[bullet_id] = {
+            'id': bullet_id,
+            'shooter_id': i % max(tank_count, 1),
+            'x': rng.randint(0, 800),
+            'y': rng.randint(0, 600),
+            'direction': rng.choice(DIRECTIONS)
+        }
+    return tanks, bullets
+
+
+class Command(BaseCommand):
+    help = "Compare per-tick Redis bytes and (de)serialisation CPU: JSON hashes vs snapshot blob"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tanks', type=int, nargs='+', default=[16, 64])
+        parser.add_argument('--bullets', type=int, nargs='+', default=[100, 1000])
+        parser.add_argument('--ticks', type=int, default=200)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'tanks':>6} {'bullets':>8} {'hash bytes':>11} {'hash us':>9} {'hash ops':>9} "
+            f"{'blob bytes':>11} {'blob us':>9} {'blob ops':>9}"
+        )
+        rng = random.Random(1)
+        for tank_count in options['tanks']:
+            for bullet_count in options['bullets']:
+                tanks, bullets = make_state(tank_count, bullet_count, rng)
+                hash_bytes, hash_us, hash_ops = self.legacy_tick(tanks, bullets, options['ticks'])
+                blob_bytes, blob_us, blob_ops = self.snapshot_tick(tanks, bullets, options['ticks'])
+                self.stdout.write(
+                    f"{tank_count:>6} {bullet_count:>8} {hash_bytes:>11} {hash_us:>9.1f} {hash_ops:>9} "
+                    f"{blob_bytes:>11} {blob_us:>9.1f} {blob_ops:>9}"
+                )
+
+    def legacy_tick(self, tanks, bullets, ticks):
+        # Прежний тик: hgetall танков и пуль в update_bullets и ещё раз в send_game_state,
+        # затем hset каждой живой пули
+        raw_tanks = {str(k): json.dumps(v) for k, v in tanks.items()}
+        raw_bullets = {k: json.dumps(v) for k, v in bullets.items()}
+        start = time.perf_counter()
+        for _ in range(ticks):
+            for _ in range(2):
+                _ = {k: json.loads(v) for k, v in raw_tanks.items()}  # Танки только читаются, но разбор тоже считаем
+                loaded_bullets = {k: json.loads(v) for k, v in raw_bullets.items()}
+            written = {k: json.dumps(v) for k, v in loaded_bullets.items()}
+        elapsed = time.perf_counter() - start
+        read_bytes = sum(len(k) + len(v) for k, v in raw_tanks.items()) + sum(len(k) + len(v) for k, v in raw_bullets.items())
+        write_bytes = sum(len(k) + len(v) for k, v in written.items())
+        return 2 * read_bytes + write_bytes, elapsed / ticks * 1e6, 4 + len(written)
+
+    def snapshot_tick(self, tanks, bullets, ticks):
+        blob = pack_snapshot(tanks, bullets)
+        start = time.perf_counter()
+        for _ in range(ticks):
+            loaded_tanks, loaded_bullets = unpack_snapshot(blob)
+            written = pack_snapshot(loaded_tanks, loaded_bullets)
+        elapsed = time.perf_counter() - start
+        return len(blob) + len(written), elapsed / ticks * 1e6, 2
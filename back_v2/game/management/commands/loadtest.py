@@ -0,0 +1,271 @@
+import asyncio
+import os
+import random
+import time
+import tracemalloc
+
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from authenticator.models import CustomUser
+from game import engine
+from game.management.commands.bench_simulation import arena
+from game.protocol import DIRECTIONS, ENCODING_MSGPACK, decode_message
+from game.redis_pool import MeteredConnectionPool, close_pool, pool_stats, set_pool
+from rooms.models import GameMap, Room
+
+
+def percentile(values, fraction):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def resident_memory():
+    # RSS процесса в байтах; None там, где нет /proc
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+def tank_direction(tank):
+    # JSON — словарь, msgpack — компактный список [id, x, y, код направления, жив]
+    if isinstance(tank, dict):
+        return tank['player_id'], tank['direction']
+    return tank[0], DIRECTIONS[tank[3]]
+
+
+# Один игрок: свой websocket к приложению, скриптованный ввод и разбор кадров
+class Player:
+    def __init__(self, communicator, player_id):
+        self.communicator = communicator
+        self.player_id = player_id
+        self.direction = None
+        self.pending = None  # (направление, когда отправили) — ждём его в кадре
+        self.measure_from = float('inf')  # Счётчики и задержки — только после прогрева
+        self.sent = 0
+        self.received = 0
+        self.latencies = []
+        self.frames = []  # (тик кадра, время прихода)
+
+    async def drive(self, rng, input_rate, shoot_every, until):
+        # Каждый ход меняет направление, поэтому его видно в первом же кадре с танком
+        last_shot = 0.0
+        while time.perf_counter() < until:
+            self.direction = rng.choice([d for d in DIRECTIONS if d != self.direction])
+            now = time.perf_counter()
+            if self.pending is None:
+                self.pending = self.direction, now
+            await self.communicator.send_json_to({'action': 'move', 'direction': self.direction})
+            measured = now >= self.measure_from
+            self.sent += measured
+            if now - last_shot >= shoot_every:
+                await self.communicator.send_json_to({'action': 'shoot'})
+                self.sent += measured
+                last_shot = now
+            await asyncio.sleep(1.0 / input_rate)
+
+    async def read(self):
+        # Напрямую из очереди: receive_from с таймаутом отменяет приложение
+        while True:
+            message = await self.communicator.output_queue.get()
+            if message['type'] != 'websocket.send':
+                return
+            now = time.perf_counter()
+            if now < self.measure_from:
+                self.pending = None
+                continue
+            self.received += 1
+            data = decode_message(message.get('text'), message.get('bytes'))
+            if data['type'] != 'state':
+                continue
+            frame = data['data']
+            self.frames.append((frame['tick'], now))
+            if self.pending is None:
+                continue
+            for tank in frame.get('tanks', ()):
+                player_id, direction = tank_direction(tank)
+                if player_id == self.player_id and direction == self.pending[0]:
+                    self.latencies.append(now - self.pending[1])
+                    self.pending = None
+                    break
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the whole websocket stack in process: N scripted players across M battles over "
+        "back_v2.asgi.application with an in-memory channel layer"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--players', type=int, default=16)
+        parser.add_argument('--battles', type=int, default=4)
+        parser.add_argument('--duration', type=float, default=10.0)
+        parser.add_argument('--warmup', type=float, default=2.0)
+        parser.add_argument('--tick-rate', type=int, default=100)
+        parser.add_argument('--broadcast-rate', type=int, default=100)
+        parser.add_argument('--input-rate', type=float, default=10.0, help="Move messages per player per second")
+        parser.add_argument('--shoot-every', type=float, default=0.5)
+        parser.add_argument('--encoding', choices=['json', ENCODING_MSGPACK], default='json')
+        # В fakeredis нет cmsgpack, поэтому с ним работает только MemoryStateBackend
+        parser.add_argument(
+            '--fake-redis', action='store_true', help="Use fakeredis (requirements-dev.txt) instead of REDIS_HOST"
+        )
+        parser.add_argument(
+            '--tracemalloc', action='store_true',
+            help="Count Python allocations instead of RSS; several times slower, latencies are not representative"
+        )
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        if options['players'] < options['battles']:
+            raise CommandError("Need at least one player per battle")
+
+        # Пользователи и комнаты — в отдельной тестовой базе, рабочая не трогается
+        overrides = {'CHANNEL_LAYERS': {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}}
+        if options['fake_redis']:
+            # Кэш Django тоже живёт в Redis; без него — в памяти процесса
+            overrides['CACHES'] = settings.LOCAL_CACHES
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(**overrides):
+                battles = self.create_battles(options)
+                report = asyncio.run(self.run(battles, options))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        self.print_report(report, options)
+
+    def create_battles(self, options):
+        per_battle = -(-options['players'] // options['battles'])
+        side = max(12, int((per_battle * 4) ** 0.5) + 2)
+        compiled = arena(side, side * 3 // 4)
+        game_map = GameMap.objects.create(
+            name='loadtest', width=compiled.width, height=compiled.height, obstacles=compiled.obstacles
+        )
+        battles = []
+        for index in range(options['battles']):
+            creator = CustomUser.objects.create_user(
+                username=f'loadtest-{index}', nickname=f'loadtest-{index}', password='x'
+            )
+            room = Room.objects.create(
+                creator=creator, map_name=game_map, max_players=per_battle,
+                tick_rate=options['tick_rate'], broadcast_rate=options['broadcast_rate']
+            )
+            battles.append((room.battle_id, []))
+        for index in range(options['players']):
+            user = CustomUser.objects.create_user(
+                username=f'loadtest-player-{index}', nickname=f'loadtest-player-{index}', password='x'
+            )
+            battles[index % options['battles']][1].append((user.id, str(RefreshToken.for_user(user).access_token)))
+        return battles
+
+    async def run(self, battles, options):
+        from back_v2.asgi import application
+
+        if options['fake_redis']:
+            # Только для нагрузочного теста, ставится из requirements-dev.txt
+            import fakeredis
+            from fakeredis.aioredis import FakeConnection
+
+            set_pool(MeteredConnectionPool(
+                connection_class=FakeConnection, server=fakeredis.FakeServer(),
+                max_connections=settings.REDIS_POOL_SIZE, timeout=settings.REDIS_POOL_TIMEOUT
+            ))
+        if options['tracemalloc']:
+            tracemalloc.start()
+            baseline, _ = tracemalloc.get_traced_memory()
+        else:
+            baseline = resident_memory()
+
+        query = f"&encoding={ENCODING_MSGPACK}" if options['encoding'] == ENCODING_MSGPACK else ''
+        players = []
+        for battle_id, members in battles:
+            for user_id, token in members:
+                communicator = WebsocketCommunicator(application, f'/ws/battle/{battle_id}/?token={token}{query}')
+                connected, _ = await communicator.connect()
+                if not connected:
+                    raise CommandError(f"Player {user_id} could not join battle {battle_id}")
+                players.append(Player(communicator, user_id))
+
+        rng = random.Random(options['seed'])
+        readers = [asyncio.create_task(player.read()) for player in players]
+        started = time.perf_counter()
+        # Прогрев не считаем: пока движки выбирают владельца, кадров нет
+        measured_from = started + options['warmup']
+        until = measured_from + options['duration']
+        for player in players:
+            player.measure_from = measured_from
+        await asyncio.gather(*(
+            player.drive(random.Random(rng.random()), options['input_rate'], options['shoot_every'], until)
+            for player in players
+        ))
+
+        report = {
+            'battles': len(battles),
+            'players': len(players),
+            'latencies': [],
+            'lateness': [],
+            'received': 0,
+            'sent': sum(player.sent for player in players),
+        }
+        step = 1.0 / options['broadcast_rate']
+        for player in players:
+            frames = player.frames
+            report['received'] += len(frames)
+            report['latencies'] += player.latencies
+            if frames:
+                # Опоздание кадра относительно сетки тиков; ноль — самый ранний кадр
+                offset = min(at - tick * step for tick, at in frames)
+                report['lateness'] += [at - tick * step - offset for tick, at in frames]
+        report['messages'] = sum(player.received for player in players)
+        engines = [item for item in engine._engines.values() if item.scheduler]
+        report['overruns'] = sum(item.scheduler.overruns for item in engines)
+        report['skipped'] = sum(item.scheduler.skipped for item in engines)
+        report['ticks'] = sum(item.scheduler.ticks for item in engines)
+        report['pool'] = pool_stats()
+        if options['tracemalloc']:
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            report['memory'] = (current - baseline) / len(battles)
+        elif baseline is not None:
+            # Прирост RSS с момента до подключения игроков, вместе с их websocket-клиентами
+            report['memory'] = (resident_memory() - baseline) / len(battles)
+
+        for reader in readers:
+            reader.cancel()
+        for player in players:
+            await player.communicator.disconnect()
+        while engine._engines:
+            await asyncio.sleep(0.05)
+        await close_pool()
+        return report
+
+    def print_report(self, report, options):
+        duration = options['duration']
+        latencies = [value * 1000 for value in report['latencies']]
+        lateness = [value * 1000 for value in report['lateness']]
+        self.stdout.write(
+            f"{report['players']} players in {report['battles']} battles, "
+            f"tick {options['tick_rate']} Hz, broadcast {options['broadcast_rate']} Hz, {options['encoding']}"
+        )
+        self.stdout.write(
+            f"inputs sent:           {report['sent'] / duration:.0f}/s\n"
+            f"messages received:     {report['messages'] / duration:.0f}/s, "
+            f"of them state frames {report['received'] / duration:.0f}/s\n"
+            f"input -> broadcast:    p50 {percentile(latencies, 0.5):.1f} ms, "
+            f"p99 {percentile(latencies, 0.99):.1f} ms ({len(latencies)} samples)\n"
+            f"tick lateness:         p50 {percentile(lateness, 0.5):.1f} ms, p99 {percentile(lateness, 0.99):.1f} ms\n"
+            f"engine ticks:          {report['ticks']}, overruns {report['overruns']}, skipped {report['skipped']}\n"
+            f"redis pool:            peak {report['pool']['peak_in_use']} of {report['pool']['max_connections']}, "
+            f"exhausted {report['pool']['exhausted']}"
+        )
+        if 'memory' in report:
+            source = 'tracemalloc' if options['tracemalloc'] else 'RSS growth'
+            self.stdout.write(f"memory per battle:     {report['memory'] / 1024:.0f} KiB ({source})")
@@ -0,0 +1,32 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from game.redis_pool import close_pool, get_redis
+from game.storage import legacy_keys, migrate_legacy_state, state_key
+
+
+class Command(BaseCommand):
+    help = "Convert live battles from per-entity Redis hashes to snapshot blobs"
+
+    def handle(self, *args, **options):
+        migrated, cleaned = asyncio.run(self.migrate())
+        self.stdout.write(self.style.SUCCESS(f"Migrated {migrated} battles, removed stale hashes of {cleaned}"))
+
+    async def migrate(self):
+        client = get_redis()
+        battle_ids = set()
+        for pattern in ('battle:*:tanks', 'battle:*:bullets'):
+            async for key in client.scan_iter(match=pattern):
+                battle_ids.add(key.decode().split(':')[1])
+
+        migrated = cleaned = 0
+        for battle_id in battle_ids:
+            if await client.exists(state_key(battle_id)):
+                # Снимок уже есть — хэши остались от старого кода
+                await client.delete(*legacy_keys(battle_id))
+                cleaned += 1
+            elif await migrate_legacy_state(client, battle_id):
+                migrated += 1
+        await close_pool()
+        return migrated, cleaned
@@ -0,0 +1,29 @@
+import asyncio
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from game import sweeper
+from game.redis_pool import close_pool
+
+
+class Command(BaseCommand):
+    help = "Deactivate expired rooms, notify their battles and delete their Redis state"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=settings.ROOM_SWEEP_BATCH)
+        parser.add_argument('--interval', type=float, help="Keep sweeping every N seconds instead of once")
+
+    def handle(self, *args, **options):
+        asyncio.run(self.run(options))
+
+    async def run(self, options):
+        try:
+            while True:
+                expired, swept = await sweeper.sweep(batch_size=options['batch'])
+                self.stdout.write(f"Expired {expired} rooms, cleared Redis state of {swept} battles")
+                if not options['interval']:
+                    break
+                await asyncio.sleep(options['interval'])
+        finally:
+            await close_pool()
@@ -0,0 +1,52 @@
+import logging
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from game.maps import CompiledMap
+
+logger = logging.getLogger(__name__)
+
+
+# Скомпилированные карты на весь процесс, ключ — (id, version) GameMap.
+# Бои получают копию (CompiledMap.copy), сам кэш никто не меняет. Правка карты
+# поднимает версию, поэтому старый ключ просто перестаёт запрашиваться; сигнал
+# из game.signals ещё и удаляет его сразу.
+class MapCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.maps = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()  # Сигналы админки приходят из потоков sync-кода
+
+    def get(self, game_map):
+        key = (game_map.id, game_map.version)
+        with self.lock:
+            compiled = self.maps.get(key)
+            if compiled is not None:
+                self.maps.move_to_end(key)
+                self.hits += 1
+                return compiled
+            self.misses += 1
+
+        compiled = CompiledMap(game_map.name, game_map.width, game_map.height, game_map.obstacles)
+        with self.lock:
+            self.maps[key] = compiled
+            self.maps.move_to_end(key)
+            while len(self.maps) > self.maxsize:
+                self.maps.popitem(last=False)
+        return compiled
+
+    def invalidate(self, map_id):
+        with self.lock:
+            for key in [key for key in self.maps if key[0] == map_id]:
+                del self.maps[key]
+        logger.info(f"Compiled map {map_id} invalidated")
+
+    def stats(self):
+        return {'size': len(self.maps), 'hits': self.hits, 'misses': self.misses}
+
+
+compiled_maps = MapCache(settings.BATTLE_MAP_CACHE_SIZE)
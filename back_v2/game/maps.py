@@ -0,0 +1,85 @@
+import copy
+import math
+
+TILE_SIZE = 64
+SOLID_TILES = ('W', 'B')
+
+
+# Скомпилированная карта: маска твёрдых клеток вместо разбора строки obstacles
+# при каждой проверке столкновения
+class CompiledMap:
+    def __init__(self, name, width, height, obstacles):
+        self.name = name
+        self.width = width
+        self.height = height
+        self.cols = width // TILE_SIZE
+        self.rows = height // TILE_SIZE
+        self.obstacles = obstacles
+        self.solid = self.compile_solid(obstacles)
+        self.spawn_points = []
+
+        for idx, tile in enumerate(obstacles[:self.cols * self.rows]):
+            if tile == 'S':
+                row, col = divmod(idx, self.cols)
+                self.spawn_points.append({
+                    'x': col * TILE_SIZE + TILE_SIZE // 2,
+                    'y': row * TILE_SIZE + TILE_SIZE // 2
+                })
+
+    def compile_solid(self, obstacles):
+        solid = bytearray(self.cols * self.rows)
+        for idx, tile in enumerate(obstacles[:self.cols * self.rows]):
+            if tile in SOLID_TILES:
+                solid[idx] = 1
+        return solid
+
+    def copy(self, obstacles=None):
+        # Копия для одного боя: разрушения меняют клетки и маску, точки
+        # появления общие. obstacles — клетки боя, если они уже отличаются.
+        clone = copy.copy(self)
+        if obstacles is None or obstacles == self.obstacles:
+            clone.solid = bytearray(self.solid)
+        else:
+            clone.obstacles = obstacles
+            clone.solid = self.compile_solid(obstacles)
+        return clone
+
+    @classmethod
+    def from_data(cls, map_data):
+        return cls(map_data['name'], map_data['width'], map_data['height'], map_data['obstacles'])
+
+    def to_data(self):
+        return {
+            'name': self.name,
+            'width': self.width,
+            'height': self.height,
+            'obstacles': self.obstacles
+        }
+
+    def is_blocked(self, rect):
+        # Проверяем только клетки, которые перекрывает прямоугольник (1-4 для танка)
+        col_start = max(int(rect['x'] // TILE_SIZE), 0)
+        col_end = min(math.ceil((rect['x'] + rect['w']) / TILE_SIZE) - 1, self.cols - 1)
+        row_start = max(int(rect['y'] // TILE_SIZE), 0)
+        row_end = min(math.ceil((rect['y'] + rect['h']) / TILE_SIZE) - 1, self.rows - 1)
+
+        solid = self.solid
+        for row in range(row_start, row_end + 1):
+            base = row * self.cols
+            for col in range(col_start, col_end + 1):
+                if solid[base + col]:
+                    return True
+        return False
+
+    def tile_index(self, x, y):
+        return int(y // TILE_SIZE) * self.cols + int(x // TILE_SIZE)
+
+    def tile_at(self, index):
+        if 0 <= index < len(self.obstacles):
+            return self.obstacles[index]
+        return None
+
+    def destroy_tile(self, index):
+        self.obstacles = self.obstacles[:index] + ' ' + self.obstacles[index + 1:]
+        if index < len(self.solid):
+            self.solid[index] = 0
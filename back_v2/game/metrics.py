@@ -0,0 +1,130 @@
+import bisect
+import time
+from contextlib import contextmanager
+
+from game.map_cache import compiled_maps
+from game.redis_pool import pool_stats
+
+# Фазы тика, секунды:
+#   tick — шаг симуляции целиком (ввод и физика), inputs — применение ввода,
+#   read / physics / write — чтение снимка, движение пуль со столкновениями
+#   и возрождением, запись снимка (read и write есть только у RedisStateBackend),
+#   encode — сборка кадров, send — group_send и send кадров и событий,
+#   serialize — JSON/msgpack одного сообщения в консьюмере
+PHASES = ('tick', 'inputs', 'read', 'physics', 'write', 'encode', 'send', 'serialize')
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+COUNTERS = ('inputs', 'inputs_dropped', 'outbound_messages', 'outbound_bytes', 'merged_frames')
+GAUGES = ('tanks', 'bullets')
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)  # Не накопительные, суммируются при выводе
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+# Метрики одного боя в этом процессе. Пишут движок, его бэкенд состояния и
+# консьюмеры; всё в одном event loop, поэтому без блокировок.
+class BattleMetrics:
+    def __init__(self):
+        self.phases = {name: Histogram() for name in PHASES}
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.gauges = dict.fromkeys(GAUGES, 0)
+        self.scheduler = None  # TickScheduler владельца: тики, опоздания, пропуски
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name].observe(time.perf_counter() - start)
+
+    def count(self, name, value=1):
+        self.counters[name] += value
+
+
+_battles = {}
+
+
+def battle(battle_id):
+    battle_id = str(battle_id)
+    metrics = _battles.get(battle_id)
+    if metrics is None:
+        metrics = _battles[battle_id] = BattleMetrics()
+    return metrics
+
+
+def forget(battle_id):
+    _battles.pop(str(battle_id), None)
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    # Текстовый формат Prometheus 0.0.4
+    lines = []
+
+    def family(name, kind, help_text, samples):
+        if not samples:
+            return
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for suffix, labels, value in samples:
+            label_text = ','.join(f'{key}="{label}"' for key, label in labels)
+            lines.append(f"{name}{suffix}{{{label_text}}} {format_value(value)}" if label_text
+                         else f"{name}{suffix} {format_value(value)}")
+
+    battles = sorted(_battles.items())
+    samples = []
+    for battle_id, metrics in battles:
+        for phase, histogram in metrics.phases.items():
+            if not histogram.count:
+                continue
+            labels = (('battle', battle_id), ('phase', phase))
+            total = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                total += count
+                samples.append(('_bucket', labels + (('le', repr(bound)),), total))
+            samples.append(('_bucket', labels + (('le', '+Inf'),), histogram.count))
+            samples.append(('_sum', labels, histogram.sum))
+            samples.append(('_count', labels, histogram.count))
+    family('battle_phase_seconds', 'histogram', "Time spent in each tick phase", samples)
+
+    scheduled = [(battle_id, metrics.scheduler) for battle_id, metrics in battles if metrics.scheduler]
+    family('battle_ticks_total', 'counter', "Simulation steps run",
+           [('', (('battle', battle_id),), scheduler.ticks) for battle_id, scheduler in scheduled])
+    family('battle_tick_overruns_total', 'counter', "Times the loop missed at least one tick deadline",
+           [('', (('battle', battle_id),), scheduler.overruns) for battle_id, scheduler in scheduled])
+    family('battle_skipped_steps_total', 'counter', "Simulation steps dropped after overruns",
+           [('', (('battle', battle_id),), scheduler.skipped) for battle_id, scheduler in scheduled])
+    for name in COUNTERS:
+        family(f'battle_{name}_total', 'counter', name.replace('_', ' ').capitalize(),
+               [('', (('battle', battle_id),), metrics.counters[name]) for battle_id, metrics in battles])
+    for name in GAUGES:
+        family(f'battle_{name}', 'gauge', f"{name.capitalize()} in the last tick",
+               [('', (('battle', battle_id),), metrics.gauges[name]) for battle_id, metrics in battles])
+
+    pool = pool_stats()
+    family('redis_pool_max_connections', 'gauge', "Redis pool size", [('', (), pool['max_connections'])])
+    family('redis_pool_in_use', 'gauge', "Redis connections checked out", [('', (), pool['in_use'])])
+    family('redis_pool_idle', 'gauge', "Idle Redis connections", [('', (), pool['idle'])])
+    family('redis_pool_peak_in_use', 'gauge', "Most Redis connections in use at once", [('', (), pool['peak_in_use'])])
+    family('redis_pool_exhausted_total', 'counter', "Waits for a free Redis connection that timed out",
+           [('', (), pool['exhausted'])])
+    cache = compiled_maps.stats()
+    family('map_cache_size', 'gauge', "Compiled maps in memory", [('', (), cache['size'])])
+    family('map_cache_hits_total', 'counter', "Compiled map cache hits", [('', (), cache['hits'])])
+    family('map_cache_misses_total', 'counter', "Compiled map cache misses", [('', (), cache['misses'])])
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,54 @@
+import asyncio
+from collections import deque
+
+from game.protocol import apply_tiles, merge_frames
+
+MAX_QUEUED_EVENTS = 1000
+
+
+# Исходящая очередь одного клиента. Обработчики сообщений канала только кладут
+# сюда и сразу возвращаются, отправкой занимается отдельная задача. Кадр
+# состояния хранится один: пока клиент не забрал прошлый, новый сливается с
+# ним. События (разрушения, конец игры) не теряются и уходят по порядку,
+# раньше ждущего кадра; поэтому разрушения сразу вносятся и в карту этого кадра.
+class Outbox:
+    def __init__(self, send, max_events=MAX_QUEUED_EVENTS):
+        self.send = send  # async send(message_type, data)
+        self.max_events = max_events
+        self.events = deque()
+        self.state = None
+        self.dropped_frames = 0
+        self.wakeup = asyncio.Event()
+
+    def put_state(self, frame):
+        # True — кадр слит с неотправленным
+        merged = self.state is not None
+        if merged:
+            self.state = merge_frames(self.state, frame)
+            self.dropped_frames += 1
+        else:
+            self.state = frame
+        self.wakeup.set()
+        return merged
+
+    def put_event(self, data):
+        # False — клиент не успевает даже за событиями, его пора отключать
+        if len(self.events) >= self.max_events:
+            return False
+        if data.get('event') == 'tiles' and self.state is not None and 'map' in self.state:
+            # Иначе клиент получит разрушения раньше карты и карта их затрёт
+            self.state = dict(self.state, map=apply_tiles(self.state['map'], data['tiles']))
+        self.events.append(data)
+        self.wakeup.set()
+        return True
+
+    async def run(self):
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            while self.events or self.state is not None:
+                if self.events:
+                    await self.send('event', self.events.popleft())
+                else:
+                    frame, self.state = self.state, None
+                    await self.send('state', frame)
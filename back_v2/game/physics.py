@@ -0,0 +1,428 @@
+import heapq
+import random
+
+try:
+    import numpy as np
+except ImportError:  # NumPy необязателен: без него всегда работает скалярный путь
+    np = None
+
+from game.maps import SOLID_TILES, TILE_SIZE
+from game.protocol import DIRECTIONS
+from game.spatial import SpatialHash
+
+TANK_SPEED = 5
+TANK_SIZE = 60
+MUZZLE_OFFSET = 32  # Пуля появляется у дула, а не в центре танка
+BULLET_SPEED = 1000  # px/с: при тике 100 Гц прежние 10 px за тик
+HIT_DISTANCE = 20
+RESPAWN_DELAY = 2.0
+# С какого числа пуль тик считается массивами NumPy. Ниже перевод словарей
+# в массивы стоит дороже, чем выигрыш (см. bench_collisions)
+VECTORIZE_THRESHOLD = 64
+# Матрица пуля×танк растёт с числом живых танков, а пространственный хэш — нет:
+# начиная отсюда он быстрее при любом числе пуль (см. bench_collisions)
+VECTORIZE_MAX_TANKS = 128
+HIT_CHUNK = 1024  # Пуль на одну матрицу пуля×танк
+
+STEPS = {'up': (0, -1), 'down': (0, 1), 'left': (-1, 0), 'right': (1, 0)}
+
+
+def spawn_tank(player_id, tanks, game_map):
+    spawn_points = game_map.spawn_points
+    if not spawn_points:
+        raise ValueError("No spawn points ('S') found")
+
+    occupied_positions = {(tank['x'], tank['y']) for tank in tanks.values()}
+    available_spawns = [
+        point for point in spawn_points
+        if (point['x'], point['y']) not in occupied_positions
+    ]
+    if not available_spawns:
+        raise ValueError("No free spawn points available")
+
+    spawn_point = random.choice(available_spawns)
+    return {
+        'player_id': player_id,
+        'x': spawn_point['x'],
+        'y': spawn_point['y'],
+        'direction': random.choice(DIRECTIONS),
+        'is_alive': True
+    }
+
+
+# move_tank и fire повторяют MOVE_TANK_SCRIPT и SHOOT_SCRIPT из game.scripts
+def move_tank(tank, direction, game_map):
+    dx, dy = 0, 0
+    if direction == 'up':
+        dy = -TANK_SPEED
+    elif direction == 'down':
+        dy = TANK_SPEED
+    elif direction == 'left':
+        dx = -TANK_SPEED
+    elif direction == 'right':
+        dx = TANK_SPEED
+
+    new_x = tank['x'] + dx
+    new_y = tank['y'] + dy
+    half = TANK_SIZE // 2
+    tank_rect = {'x': new_x - half, 'y': new_y - half, 'w': TANK_SIZE, 'h': TANK_SIZE}
+    if not game_map.is_blocked(tank_rect):
+        tank['x'] = max(0, min(game_map.width, new_x))
+        tank['y'] = max(0, min(game_map.height, new_y))
+    tank['direction'] = direction
+
+
+def fire(tank, bullet_id):
+    direction = tank['direction']
+    x, y = tank['x'], tank['y']
+    if direction == 'up':
+        y -= MUZZLE_OFFSET
+    elif direction == 'down':
+        y += MUZZLE_OFFSET
+    elif direction == 'left':
+        x -= MUZZLE_OFFSET
+    elif direction == 'right':
+        x += MUZZLE_OFFSET
+    return {'id': bullet_id, 'shooter_id': tank['player_id'], 'x': x, 'y': y, 'direction': direction}
+
+
+# Очередь возрождения (куча по сроку) и занятость точек появления живыми
+# танками. Занятость обновляется при каждом движении, появлении и гибели,
+# поэтому тик платит только за танки, чей срок уже наступил.
+class Respawner:
+    def __init__(self, spawn_points, tanks=None):
+        self.spawn_points = spawn_points
+        self.occupants = {(point['x'], point['y']): set() for point in spawn_points}
+        self.queue = []
+        for tank_id, tank in (tanks or {}).items():
+            if tank['is_alive']:
+                self.placed(tank_id, tank)
+            elif 'death_time' in tank:
+                heapq.heappush(self.queue, (tank['death_time'] + RESPAWN_DELAY, tank_id))
+
+    def placed(self, tank_id, tank):
+        occupants = self.occupants.get((tank['x'], tank['y']))
+        if occupants is not None and tank['is_alive']:
+            occupants.add(tank_id)
+
+    def left(self, tank_id, x, y):
+        occupants = self.occupants.get((x, y))
+        if occupants is not None:
+            occupants.discard(tank_id)
+
+    def moved(self, tank_id, tank, old_x, old_y):
+        if (old_x, old_y) != (tank['x'], tank['y']):
+            self.left(tank_id, old_x, old_y)
+            self.placed(tank_id, tank)
+
+    def killed(self, tank_id, tank):
+        self.left(tank_id, tank['x'], tank['y'])
+        heapq.heappush(self.queue, (tank['death_time'] + RESPAWN_DELAY, tank_id))
+
+    def respawn(self, tanks, now):
+        respawned = []
+        waiting = []
+        while self.queue and self.queue[0][0] <= now:
+            due, tank_id = heapq.heappop(self.queue)
+            tank = tanks.get(tank_id)
+            # Танк ушёл из боя или уже ожил — запись устарела
+            if tank is None or tank['is_alive'] or tank.get('death_time', due) + RESPAWN_DELAY != due:
+                continue
+            available_spawns = [
+                point for point in self.spawn_points
+                if not self.occupants[(point['x'], point['y'])]
+            ]
+            if not available_spawns:
+                waiting.append((due, tank_id))  # Все точки заняты, попробуем на следующем тике
+                continue
+            new_spawn = random.choice(available_spawns)
+            tank['x'] = new_spawn['x']
+            tank['y'] = new_spawn['y']
+            tank['is_alive'] = True
+            tank.pop('death_time', None)
+            self.placed(tank_id, tank)
+            respawned.append(tank_id)
+        for entry in waiting:
+            heapq.heappush(self.queue, entry)
+        return respawned
+
+
+def respawn_tanks(tanks, game_map, now):
+    # Для состояния, которое читается заново каждый тик (RedisStateBackend)
+    return Respawner(game_map.spawn_points, tanks).respawn(tanks, now)
+
+
+def index_tanks(tanks):
+    # В ячейках лежит (порядковый номер, танк): при равном пути до попадания
+    # побеждает танк, который раньше в обходе, как и при полном переборе
+    grid = SpatialHash()
+    for order, (tank_id, tank) in enumerate(tanks.items()):
+        if tank['is_alive']:
+            grid.insert(tank_id, (order, tank), tank['x'], tank['y'], HIT_DISTANCE)
+    return grid
+
+
+def tank_entry(x, y, dx, dy, distance, tank):
+    # Путь пули до входа в квадрат попадания танка или None, если отрезок
+    # (x, y) -> (x + dx * distance, y + dy * distance) его не задевает
+    if dx:
+        if abs(tank['y'] - y) >= HIT_DISTANCE:
+            return None
+        near = (tank['x'] - x) * dx - HIT_DISTANCE
+    else:
+        if abs(tank['x'] - x) >= HIT_DISTANCE:
+            return None
+        near = (tank['y'] - y) * dy - HIT_DISTANCE
+    if near + 2 * HIT_DISTANCE <= 0 or near >= distance:
+        return None
+    return max(near, 0)
+
+
+def find_hit(x, y, dx, dy, distance, grid):
+    best = None
+    end_x, end_y = x + dx * distance, y + dy * distance
+    for tank_id, (order, tank) in grid.along(x, y, end_x, end_y).items():
+        t = tank_entry(x, y, dx, dy, distance, tank)
+        if t is not None and (best is None or (t, order) < best[:2]):
+            best = t, order, tank_id, tank
+    return best and (best[0], best[2], best[3])
+
+
+def scan_hit(x, y, dx, dy, distance, tanks):
+    best = None
+    for tank_id, tank in tanks.items():
+        if not tank['is_alive']:
+            continue
+        t = tank_entry(x, y, dx, dy, distance, tank)
+        if t is not None and (best is None or t < best[0]):
+            best = t, tank_id, tank
+    return best
+
+
+def tile_entry(x, y, dx, dy, distance, game_map):
+    # Первая непроходимая клетка на пути: (путь до неё, индекс клетки). Клетки
+    # обходятся по одной вдоль оси движения, начиная с той, где стоит пуля.
+    # Всё за краем сетки тоже считается стеной, индекс у такой клетки None.
+    cols, rows = game_map.cols, game_map.rows
+    if dx:
+        pos, step, fixed, count = x, dx, int(y // TILE_SIZE), cols
+        fixed_ok = 0 <= fixed < rows
+    else:
+        pos, step, fixed, count = y, dy, int(x // TILE_SIZE), rows
+        fixed_ok = 0 <= fixed < cols
+    first = int(pos // TILE_SIZE)
+    last = int((pos + step * distance) // TILE_SIZE)
+
+    for cell in range(first, last + step, step):
+        if cell == first:
+            t = 0
+        elif step > 0:
+            t = cell * TILE_SIZE - pos
+        else:
+            t = pos - (cell + 1) * TILE_SIZE
+        if not (fixed_ok and 0 <= cell < count):
+            return t, None
+        index = fixed * cols + cell if dx else cell * cols + fixed
+        tile = game_map.tile_at(index)
+        if tile is None or tile in SOLID_TILES:
+            return t, index
+    return None
+
+
+def bounds_exit(x, y, dx, dy, distance, game_map):
+    # Путь до выхода за границу карты или None
+    if dx:
+        limit = game_map.width - x if dx > 0 else x
+    else:
+        limit = game_map.height - y if dy > 0 else y
+    return limit if limit < distance else None
+
+
+def step_bullets(bullets, tanks, game_map, now, dt, spatial=True, vectorized=None):
+    # vectorized=None — выбрать путь по числу пуль и живых танков
+    if vectorized is None:
+        vectorized = (
+            np is not None and len(bullets) >= VECTORIZE_THRESHOLD and
+            sum(tank['is_alive'] for tank in tanks.values()) < VECTORIZE_MAX_TANKS
+        )
+    if vectorized and bullets:
+        return step_bullets_vectorized(bullets, tanks, game_map, now, dt)
+    return step_bullets_scalar(bullets, tanks, game_map, now, dt, spatial)
+
+
+def step_bullets_scalar(bullets, tanks, game_map, now, dt, spatial=True):
+    # Пуля за тик проходит отрезок BULLET_SPEED * dt, и проверяется весь отрезок,
+    # а не только конечная точка, поэтому при низкой частоте тиков она не
+    # пролетает сквозь танки и стены. Из нескольких препятствий на отрезке
+    # срабатывает ближайшее, при равном пути — танк, граница, клетка.
+    # Возвращает (оставшиеся пули, удалённые id, подбитые танки, разрушенные клетки)
+    distance = BULLET_SPEED * dt
+    grid = index_tanks(tanks) if spatial else None
+    new_bullets = {}
+    bullets_to_remove = []
+    hit_tanks = []
+    destroyed_tiles = []
+
+    for bullet_id, bullet in bullets.items():
+        x, y = bullet['x'], bullet['y']
+        dx, dy = STEPS[bullet['direction']]
+
+        if spatial:
+            hit = find_hit(x, y, dx, dy, distance, grid)
+        else:
+            hit = scan_hit(x, y, dx, dy, distance, tanks)
+        out = bounds_exit(x, y, dx, dy, distance, game_map)
+        wall = tile_entry(x, y, dx, dy, distance, game_map)
+
+        if hit and (out is None or hit[0] <= out) and (wall is None or hit[0] <= wall[0]):
+            _, tank_id, tank = hit
+            if spatial:
+                grid.remove(tank_id)
+            tank['is_alive'] = False
+            tank['death_time'] = now
+            hit_tanks.append(tank_id)
+            bullets_to_remove.append(bullet_id)
+        elif out is not None and (wall is None or out <= wall[0]):
+            bullets_to_remove.append(bullet_id)
+        elif wall:
+            index = wall[1]
+            if index is not None and game_map.tile_at(index) == 'B':
+                game_map.destroy_tile(index)
+                destroyed_tiles.append(index)
+            bullets_to_remove.append(bullet_id)
+        else:
+            bullet['x'] = x + dx * distance
+            bullet['y'] = y + dy * distance
+            new_bullets[bullet_id] = bullet
+
+    return new_bullets, bullets_to_remove, hit_tanks, destroyed_tiles
+
+
+def step_bullets_vectorized(bullets, tanks, game_map, now, dt):
+    # То же, что step_bullets_scalar, но препятствия для всех пуль ищутся
+    # массивами: граница, клетки вдоль пути и матрица пуля×танк. Так считается
+    # всё против состояния на начало тика; в скалярном пути пуля уже не видит
+    # танк, подбитый раньше в этом тике, и кирпич, разрушенный раньше. Поэтому
+    # результаты применяются по порядку, и пуля, чьё препятствие уже исчезло,
+    # пересчитывается скалярно — итог совпадает до бита.
+    distance = BULLET_SPEED * dt
+    items = list(bullets.items())
+    n = len(items)
+    x = np.fromiter((bullet['x'] for _, bullet in items), float, n)
+    y = np.fromiter((bullet['y'] for _, bullet in items), float, n)
+    steps = np.array([STEPS[bullet['direction']] for _, bullet in items], dtype=np.int64).reshape(n, 2)
+    dx, dy = steps[:, 0], steps[:, 1]
+    horizontal = dx != 0
+
+    # Граница карты
+    limit = np.where(
+        horizontal,
+        np.where(dx > 0, game_map.width - x, x),
+        np.where(dy > 0, game_map.height - y, y)
+    )
+    out = np.where(limit < distance, limit, np.inf)
+
+    # Клетки вдоль пути: шаг j проверяет j-ю клетку от стартовой сразу у всех пуль
+    cols, rows = game_map.cols, game_map.rows
+    tiles = np.frombuffer(game_map.obstacles.encode(), dtype=np.uint8)
+    blocking = (tiles == ord('W')) | (tiles == ord('B'))
+    pos = np.where(horizontal, x, y)
+    step = np.where(horizontal, dx, dy)
+    fixed = np.floor_divide(np.where(horizontal, y, x), TILE_SIZE).astype(np.int64)
+    fixed_ok = (fixed >= 0) & (fixed < np.where(horizontal, rows, cols))
+    count = np.where(horizontal, cols, rows)
+    first = np.floor_divide(pos, TILE_SIZE).astype(np.int64)
+    last = np.floor_divide(pos + step * distance, TILE_SIZE).astype(np.int64)
+    span = np.abs(last - first)
+    wall = np.full(n, np.inf)
+    wall_index = np.full(n, -1, dtype=np.int64)  # -1 — за краем сетки
+    pending = np.ones(n, dtype=bool)
+    for j in range(int(span.max()) + 1):
+        cell = first + step * j
+        if j == 0:
+            t = np.zeros(n)
+        else:
+            t = np.where(step > 0, cell * TILE_SIZE - pos, pos - (cell + 1) * TILE_SIZE)
+        inside = fixed_ok & (cell >= 0) & (cell < count)
+        index = np.where(horizontal, fixed * cols + cell, cell * cols + fixed)
+        known = inside & (index < len(tiles))
+        solid = np.zeros(n, dtype=bool)
+        solid[known] = blocking[index[known]]
+        blocked = pending & (span >= j) & (~known | solid)
+        wall[blocked] = t[blocked]
+        wall_index[blocked] = np.where(inside, index, -1)[blocked]
+        pending &= ~blocked
+
+    # Танки: вход в квадрат попадания, при равном пути — первый по порядку
+    alive = [(tank_id, tank) for tank_id, tank in tanks.items() if tank['is_alive']]
+    hit = np.full(n, np.inf)
+    hit_tank = np.full(n, -1, dtype=np.int64)
+    if alive:
+        tx = np.fromiter((tank['x'] for _, tank in alive), float, len(alive))
+        ty = np.fromiter((tank['y'] for _, tank in alive), float, len(alive))
+        for start in range(0, n, HIT_CHUNK):
+            chunk = slice(start, start + HIT_CHUNK)
+            across_x = tx - x[chunk, None]
+            across_y = ty - y[chunk, None]
+            along_x = horizontal[chunk, None]
+            across = np.where(along_x, np.abs(across_y), np.abs(across_x))
+            near = np.where(along_x, across_x * dx[chunk, None], across_y * dy[chunk, None]) - HIT_DISTANCE
+            entry = np.where(
+                (across < HIT_DISTANCE) & (near + 2 * HIT_DISTANCE > 0) & (near < distance),
+                np.maximum(near, 0), np.inf
+            )
+            best = entry.argmin(axis=1)
+            best_entry = entry[np.arange(len(best)), best]
+            hit[chunk] = best_entry
+            hit_tank[chunk] = np.where(np.isfinite(best_entry), best, -1)
+
+    tank_first = (hit_tank >= 0) & (hit <= out) & (hit <= wall)
+    out_first = ~tank_first & np.isfinite(out) & (out <= wall)
+    wall_first = ~tank_first & ~out_first & np.isfinite(wall)
+    new_x = (x + dx * distance).tolist()
+    new_y = (y + dy * distance).tolist()
+
+    new_bullets = {}
+    bullets_to_remove = []
+    hit_tanks = []
+    destroyed_tiles = []
+    tank_first, out_first, wall_first = tank_first.tolist(), out_first.tolist(), wall_first.tolist()
+    hit_tank, wall_index = hit_tank.tolist(), wall_index.tolist()
+
+    for i, (bullet_id, bullet) in enumerate(items):
+        if tank_first[i]:
+            tank_id, tank = alive[hit_tank[i]]
+            if tank['is_alive']:
+                tank['is_alive'] = False
+                tank['death_time'] = now
+                hit_tanks.append(tank_id)
+                bullets_to_remove.append(bullet_id)
+                continue
+        elif out_first[i]:
+            bullets_to_remove.append(bullet_id)
+            continue
+        elif wall_first[i]:
+            index = wall_index[i]
+            tile = game_map.tile_at(index) if index >= 0 else None
+            if tile == 'B':
+                game_map.destroy_tile(index)
+                destroyed_tiles.append(index)
+            if index < 0 or tile is None or tile in SOLID_TILES:
+                bullets_to_remove.append(bullet_id)
+                continue
+        else:
+            bullet['x'] = new_x[i]
+            bullet['y'] = new_y[i]
+            new_bullets[bullet_id] = bullet
+            continue
+
+        # Препятствие исчезло раньше в этом тике — пуля считается заново
+        kept, removed, hit_now, destroyed_now = step_bullets_scalar(
+            {bullet_id: bullet}, tanks, game_map, now, dt, spatial=False
+        )
+        new_bullets.update(kept)
+        bullets_to_remove.extend(removed)
+        hit_tanks.extend(hit_now)
+        destroyed_tiles.extend(destroyed_now)
+
+    return new_bullets, bullets_to_remove, hit_tanks, destroyed_tiles
@@ -0,0 +1,174 @@
+import json
+
+import msgpack
+
+KEYFRAME_INTERVAL = 100  # Кадров между полными; движок ставит частоту рассылки, т.е. раз в секунду
+
+ENCODING_JSON = 'json'
+ENCODING_MSGPACK = 'msgpack'
+DIRECTIONS = ('up', 'down', 'left', 'right')
+DIRECTION_CODES = {direction: code for code, direction in enumerate(DIRECTIONS)}
+
+
+# Кадры состояния: ключевой кадр целиком и дельты между ними. Дельта несёт
+# номер тика и base — тик, от которого она посчитана; клиент применяет её,
+# если его последний тик не меньше base. Сущности в дельте передаются
+# целиком, поэтому повторное применение ничего не ломает.
+class FrameEncoder:
+    def __init__(self, battle_id, tick=0, keyframe_interval=KEYFRAME_INTERVAL):
+        self.battle_id = str(battle_id)
+        self.tick = tick
+        self.keyframe_interval = keyframe_interval
+        self.base = None
+        self.tanks = {}
+        self.bullets = {}
+        self.time_left = None
+
+    def advance(self, tanks, bullets, time_left):
+        self.tick += 1
+        tanks = {tank['player_id']: tank for tank in tanks}
+        bullets = {bullet['id']: bullet for bullet in bullets}
+
+        frame = {}
+        changed_tanks = [tank for player_id, tank in tanks.items() if self.tanks.get(player_id) != tank]
+        removed_tanks = [player_id for player_id in self.tanks if player_id not in tanks]
+        changed_bullets = [bullet for bullet_id, bullet in bullets.items() if self.bullets.get(bullet_id) != bullet]
+        removed_bullets = [bullet_id for bullet_id in self.bullets if bullet_id not in bullets]
+        if changed_tanks:
+            frame['tanks'] = changed_tanks
+        if removed_tanks:
+            frame['removed_tanks'] = removed_tanks
+        if changed_bullets:
+            frame['bullets'] = changed_bullets
+        if removed_bullets:
+            frame['removed_bullets'] = removed_bullets
+        if time_left != self.time_left:
+            frame['time_left'] = time_left
+
+        self.tanks = tanks
+        self.bullets = bullets
+        self.time_left = time_left
+        if not frame or self.base is None:
+            return None  # Ничего не изменилось — кадр не отправляем
+        frame['tick'] = self.tick
+        frame['base'] = self.base
+        self.base = self.tick
+        return frame
+
+    def keyframe_due(self):
+        return self.base is None or self.tick % self.keyframe_interval == 0
+
+    def keyframe(self, map_data=None, rebase=False):
+        # rebase только для кадра всей группе: кадр одному игроку не должен
+        # сдвигать base для остальных
+        frame = {
+            'tick': self.tick,
+            'keyframe': True,
+            'battle_id': self.battle_id,
+            'time_left': self.time_left,
+            'tanks': list(self.tanks.values()),
+            'bullets': list(self.bullets.values())
+        }
+        if map_data:
+            frame['map'] = map_data
+        if rebase:
+            self.base = self.tick
+        return frame
+
+
+def apply_delta(keyframe, delta):
+    tanks = {tank['player_id']: tank for tank in keyframe['tanks']}
+    bullets = {bullet['id']: bullet for bullet in keyframe['bullets']}
+    for tank in delta.get('tanks', ()):
+        tanks[tank['player_id']] = tank
+    for player_id in delta.get('removed_tanks', ()):
+        tanks.pop(player_id, None)
+    for bullet in delta.get('bullets', ()):
+        bullets[bullet['id']] = bullet
+    for bullet_id in delta.get('removed_bullets', ()):
+        bullets.pop(bullet_id, None)
+    merged = dict(keyframe, tick=delta['tick'], tanks=list(tanks.values()), bullets=list(bullets.values()))
+    if 'time_left' in delta:
+        merged['time_left'] = delta['time_left']
+    return merged
+
+
+def apply_tiles(map_data, tiles):
+    # Разрушения из события tiles поверх карты кадра; уже учтённые ничего не меняют
+    obstacles = list(map_data['obstacles'])
+    for diff in tiles:
+        obstacles[diff['index']] = diff['tile']
+    return dict(map_data, obstacles=''.join(obstacles))
+
+
+def merge_frames(older, newer):
+    # Один кадр вместо двух неотправленных: клиент получит то же состояние,
+    # что и после применения обоих по очереди
+    if newer.get('keyframe'):
+        if 'map' in older and 'map' not in newer:
+            newer = dict(newer, map=older['map'])
+        return newer
+    if newer['tick'] <= older['tick']:
+        return older
+    if newer['base'] > older['tick']:
+        return newer  # Между кадрами разрыв — клиент сам попросит resync
+    if older.get('keyframe'):
+        return apply_delta(older, newer)
+
+    merged = {'tick': newer['tick'], 'base': older['base']}
+    for changed_key, removed_key, id_key in (('tanks', 'removed_tanks', 'player_id'), ('bullets', 'removed_bullets', 'id')):
+        changed = {item[id_key]: item for item in older.get(changed_key, ())}
+        removed = set(older.get(removed_key, ()))
+        for entity_id in newer.get(removed_key, ()):
+            changed.pop(entity_id, None)
+            removed.add(entity_id)
+        for item in newer.get(changed_key, ()):
+            changed[item[id_key]] = item
+            removed.discard(item[id_key])
+        if changed:
+            merged[changed_key] = list(changed.values())
+        if removed:
+            merged[removed_key] = list(removed)
+    if 'time_left' in newer:
+        merged['time_left'] = newer['time_left']
+    elif 'time_left' in older:
+        merged['time_left'] = older['time_left']
+    return merged
+
+
+# Бинарный формат: msgpack, танки и пули — массивы фиксированного вида
+# [player_id, x, y, direction, is_alive] и [id, shooter_id, x, y, direction],
+# направление — индекс в DIRECTIONS
+def pack_tank(tank):
+    return [tank['player_id'], tank['x'], tank['y'], DIRECTION_CODES.get(tank['direction'], 0), tank['is_alive']]
+
+
+def pack_bullet(bullet):
+    return [bullet['id'], bullet['shooter_id'], bullet['x'], bullet['y'], DIRECTION_CODES.get(bullet['direction'], 0)]
+
+
+def compact_state(data):
+    data = dict(data)
+    if 'tanks' in data:
+        data['tanks'] = [pack_tank(tank) for tank in data['tanks']]
+    if 'bullets' in data:
+        data['bullets'] = [pack_bullet(bullet) for bullet in data['bullets']]
+    return data
+
+
+def encode_message(message_type, data, encoding):
+    # Возвращает (text_data, bytes_data) для AsyncWebsocketConsumer.send
+    if encoding == ENCODING_MSGPACK:
+        if message_type == 'state':
+            data = compact_state(data)
+        return None, msgpack.packb({'type': message_type, 'data': data})
+    return json.dumps({'type': message_type, 'data': data}), None
+
+
+def decode_message(text_data=None, bytes_data=None):
+    if bytes_data is not None:
+        data = msgpack.unpackb(bytes_data)
+        if isinstance(data.get('direction'), int) and 0 <= data['direction'] < len(DIRECTIONS):
+            data['direction'] = DIRECTIONS[data['direction']]
+        return data
+    return json.loads(text_data)
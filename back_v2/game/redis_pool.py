@@ -0,0 +1,84 @@
+import asyncio
+import logging
+import weakref
+
+import redis.asyncio as redis
+from django.conf import settings
+from redis.exceptions import ConnectionError
+
+logger = logging.getLogger(__name__)
+
+# Один пул на процесс (точнее, на event loop: соединения asyncio к нему привязаны).
+# Консьюмеры и движки боёв берут соединение на время команды и сразу возвращают,
+# поэтому число соединений к Redis ограничено REDIS_POOL_SIZE, а не числом игроков.
+_pools = weakref.WeakKeyDictionary()
+
+
+class MeteredConnectionPool(redis.BlockingConnectionPool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.peak_in_use = 0
+        self.exhausted = 0  # Сколько раз не дождались свободного соединения
+
+    async def get_connection(self, command_name, *keys, **options):
+        try:
+            connection = await super().get_connection(command_name, *keys, **options)
+        except ConnectionError:
+            # Таймаут ожидания, а не обрыв: все соединения заняты
+            if len(self._in_use_connections) >= self.max_connections:
+                self.exhausted += 1
+                logger.warning(f"Redis pool exhausted: {self.max_connections} connections in use")
+            raise
+        self.peak_in_use = max(self.peak_in_use, len(self._in_use_connections))
+        return connection
+
+    def stats(self):
+        in_use = len(self._in_use_connections)
+        return {
+            'max_connections': self.max_connections,
+            'in_use': in_use,
+            'idle': len(self._available_connections),
+            'peak_in_use': self.peak_in_use,
+            'exhausted': self.exhausted,
+        }
+
+
+def get_pool():
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(loop)
+    if pool is None:
+        pool = MeteredConnectionPool(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            max_connections=settings.REDIS_POOL_SIZE,
+            timeout=settings.REDIS_POOL_TIMEOUT,
+            health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL,
+            socket_keepalive=True,
+        )
+        _pools[loop] = pool
+    return pool
+
+
+def set_pool(pool):
+    # Свой пул для текущего event loop — например, поверх fakeredis в loadtest
+    _pools[asyncio.get_running_loop()] = pool
+
+
+def get_redis():
+    # Клиент лёгкий и ничего не держит: соединения живут в общем пуле
+    return redis.Redis(connection_pool=get_pool())
+
+
+def pool_stats():
+    # Сумма по всем пулам процесса; обычно пул один — у daphne один event loop
+    totals = {'max_connections': 0, 'in_use': 0, 'idle': 0, 'peak_in_use': 0, 'exhausted': 0}
+    for pool in list(_pools.values()):
+        for name, value in pool.stats().items():
+            totals[name] += value
+    return totals
+
+
+async def close_pool():
+    pool = _pools.pop(asyncio.get_running_loop(), None)
+    if pool is not None:
+        await pool.disconnect()
@@ -0,0 +1,41 @@
+CATCH_UP = 'catch_up'
+SKIP = 'skip'
+
+
+# Фиксированный шаг симуляции. Моменты тиков лежат на сетке start + n * step,
+# поэтому задержки не накапливаются. Если цикл опоздал на несколько шагов,
+# catch_up догоняет их подряд (не больше max_catch_up за раз), skip делает
+# один шаг; остальные пропущенные шаги отбрасываются.
+class TickScheduler:
+    def __init__(self, tick_rate, broadcast_rate, policy=CATCH_UP, max_catch_up=5):
+        self.step = 1.0 / tick_rate
+        # Кадр клиентам — каждый broadcast_every-й тик
+        self.broadcast_every = max(1, round(tick_rate / broadcast_rate))
+        self.policy = policy
+        self.max_catch_up = max_catch_up
+        self.next_time = None
+        self.ticks = 0
+        self.overruns = 0  # Сколько раз цикл пропустил хотя бы один срок тика
+        self.skipped = 0  # Сколько шагов симуляции выброшено
+
+    def start(self, now):
+        self.next_time = now
+
+    def advance(self, now):
+        # Возвращает (сколько шагов симулировать сейчас, слать ли кадр)
+        if now < self.next_time:
+            return 0, False
+        due = int((now - self.next_time) // self.step) + 1
+        if due > 1:
+            self.overruns += 1
+        steps = 1 if self.policy == SKIP else min(due, self.max_catch_up)
+        self.skipped += due - steps
+        self.next_time += due * self.step
+
+        before = self.ticks
+        self.ticks += steps
+        broadcast = self.ticks // self.broadcast_every > before // self.broadcast_every
+        return steps, broadcast
+
+    def delay(self, now):
+        return max(0.0, self.next_time - now)
@@ -0,0 +1,112 @@
+# Lua-скрипты ввода: читают снимок боя (см. game.storage) и клетки карты
+# прямо в Redis, поэтому ход или выстрел — один EVALSHA вместо чтения и записи.
+# KEYS[1] — battle:{id}:state, KEYS[2] — battle:{id}:tiles.
+# Танк в снимке: {player_id, x, y, direction, is_alive[, death_time]},
+# направление — индекс в DIRECTIONS (0 up, 1 down, 2 left, 3 right).
+
+FIND_TANK = """
+local function find_tank(snapshot, player_id)
+    for _, tank in ipairs(snapshot[2]) do
+        if tank[1] == player_id then
+            return tank
+        end
+    end
+    return nil
+end
+"""
+
+# ARGV: player_id, direction, speed, half_size, width, height, cols, rows, tile_size, steps
+MOVE_TANK_SCRIPT = FIND_TANK + """
+local blob = redis.call('get', KEYS[1])
+if not blob then
+    return 0
+end
+local snapshot = cmsgpack.unpack(blob)
+if snapshot[1] ~= 1 then
+    return redis.error_reply('unsupported battle snapshot version')
+end
+local tank = find_tank(snapshot, tonumber(ARGV[1]))
+if not tank then
+    return 0
+end
+
+local direction = tonumber(ARGV[2])
+local speed = tonumber(ARGV[3])
+local half = tonumber(ARGV[4])
+local width, height = tonumber(ARGV[5]), tonumber(ARGV[6])
+local cols, rows = tonumber(ARGV[7]), tonumber(ARGV[8])
+local tile = tonumber(ARGV[9])
+
+-- Шаг на каждое сообщение хода за тик, как move_tank в цикле Simulation.move;
+-- упёрся — дальше стоит на месте
+for step = 1, tonumber(ARGV[10]) do
+    local new_x, new_y = tank[2], tank[3]
+    if direction == 0 then
+        new_y = new_y - speed
+    elseif direction == 1 then
+        new_y = new_y + speed
+    elseif direction == 2 then
+        new_x = new_x - speed
+    else
+        new_x = new_x + speed
+    end
+
+    -- Те же клетки, что проверяет CompiledMap.is_blocked: по одному GETRANGE на ряд
+    local col_start = math.max(math.floor((new_x - half) / tile), 0)
+    local col_end = math.min(math.ceil((new_x + half) / tile) - 1, cols - 1)
+    local row_start = math.max(math.floor((new_y - half) / tile), 0)
+    local row_end = math.min(math.ceil((new_y + half) / tile) - 1, rows - 1)
+    local blocked = false
+    if col_start <= col_end then
+        for row = row_start, row_end do
+            local tiles = redis.call('getrange', KEYS[2], row * cols + col_start, row * cols + col_end)
+            if string.find(tiles, '[WB]') then
+                blocked = true
+                break
+            end
+        end
+    end
+    if blocked then
+        break
+    end
+    tank[2] = math.max(0, math.min(width, new_x))
+    tank[3] = math.max(0, math.min(height, new_y))
+end
+tank[4] = direction
+redis.call('set', KEYS[1], cmsgpack.pack(snapshot))
+return 1
+"""
+
+# ARGV: player_id, bullet_id, muzzle_offset
+SHOOT_SCRIPT = FIND_TANK + """
+local blob = redis.call('get', KEYS[1])
+if not blob then
+    return 0
+end
+local snapshot = cmsgpack.unpack(blob)
+if snapshot[1] ~= 1 then
+    return redis.error_reply('unsupported battle snapshot version')
+end
+local player_id = tonumber(ARGV[1])
+local tank = find_tank(snapshot, player_id)
+if not tank then
+    return 0
+end
+
+local offset = tonumber(ARGV[3])
+local direction = tank[4]
+local x, y = tank[2], tank[3]
+if direction == 0 then
+    y = y - offset
+elseif direction == 1 then
+    y = y + offset
+elseif direction == 2 then
+    x = x - offset
+else
+    x = x + offset
+end
+
+table.insert(snapshot[3], {ARGV[2], player_id, x, y, direction})
+redis.call('set', KEYS[1], cmsgpack.pack(snapshot))
+return 1
+"""
@@ -0,0 +1,11 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from game.map_cache import compiled_maps
+from rooms.models import GameMap
+
+
+@receiver(post_save, sender=GameMap)
+@receiver(post_delete, sender=GameMap)
+def invalidate_compiled_map(sender, instance, **kwargs):
+    compiled_maps.invalidate(instance.id)
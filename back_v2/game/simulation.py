@@ -0,0 +1,66 @@
+from game.physics import Respawner, fire, move_tank, spawn_tank, step_bullets
+
+
+def bullet_id(player_id, now):
+    return f"{player_id}:{int(now * 1000)}"
+
+
+# Правила боя без ввода-вывода: состояние и ввод тика на входе, новое
+# состояние и события на выходе. Его вызывают бэкенды состояния, а бенчмарк
+# bench_simulation гоняет его напрямую, без Redis и каналов.
+class Simulation:
+    def __init__(self, game_map, tanks=None, bullets=None):
+        self.game_map = game_map
+        self.tanks = tanks if tanks is not None else {}
+        self.bullets = bullets if bullets is not None else {}
+        self.respawner = Respawner(game_map.spawn_points, self.tanks)
+
+    def join(self, player_id):
+        # None — танк игрока уже на поле
+        if player_id in self.tanks:
+            return None
+        tank = spawn_tank(player_id, self.tanks, self.game_map)
+        self.tanks[player_id] = tank
+        self.respawner.placed(player_id, tank)
+        return tank
+
+    def leave(self, player_id):
+        tank = self.tanks.pop(player_id, None)
+        if tank:
+            self.respawner.left(player_id, tank['x'], tank['y'])
+        return tank is not None
+
+    def move(self, player_id, direction, steps=1):
+        tank = self.tanks.get(player_id)
+        if not tank:
+            return False
+        x, y = tank['x'], tank['y']
+        for _ in range(steps):
+            move_tank(tank, direction, self.game_map)
+        self.respawner.moved(player_id, tank, x, y)
+        return True
+
+    def shoot(self, player_id, bullet_id):
+        tank = self.tanks.get(player_id)
+        if not tank:
+            return False
+        self.bullets[bullet_id] = fire(tank, bullet_id)
+        return True
+
+    def apply_inputs(self, batch, now):
+        # Ход раньше выстрела: пуля летит в новом направлении
+        changed = False
+        for player_id, direction, steps, shoot in batch:
+            if direction:
+                changed = self.move(player_id, direction, steps) or changed
+            if shoot:
+                changed = self.shoot(player_id, bullet_id(player_id, now)) or changed
+        return changed
+
+    def step(self, now, dt):
+        # Возвращает (возрождённые танки, подбитые танки, разрушенные клетки)
+        respawned = self.respawner.respawn(self.tanks, now)
+        self.bullets, _, hit_tanks, destroyed_tiles = step_bullets(self.bullets, self.tanks, self.game_map, now, dt)
+        for tank_id in hit_tanks:
+            self.respawner.killed(tank_id, self.tanks[tank_id])
+        return respawned, hit_tanks, destroyed_tiles
@@ -0,0 +1,64 @@
+from game.maps import TILE_SIZE
+
+
+# Равномерная сетка с ячейками размером в клетку карты, строится заново на каждом
+# тике. Объект с радиусом попадает во все ячейки, которые задевает его квадрат,
+# поэтому запросу точки достаточно одной ячейки, а отрезку — ячеек, которые
+# он пересекает.
+class SpatialHash:
+    def __init__(self, cell_size=TILE_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.keys = {}
+
+    def cell_of(self, x, y):
+        return int(x // self.cell_size), int(y // self.cell_size)
+
+    def cells_around(self, x, y, radius):
+        size = self.cell_size
+        for col in range(int((x - radius) // size), int((x + radius) // size) + 1):
+            for row in range(int((y - radius) // size), int((y + radius) // size) + 1):
+                yield col, row
+
+    def insert(self, key, item, x, y, radius=0):
+        cells = list(self.cells_around(x, y, radius))
+        for cell in cells:
+            self.cells.setdefault(cell, {})[key] = item
+        self.keys[key] = cells
+
+    def remove(self, key):
+        for cell in self.keys.pop(key, ()):
+            bucket = self.cells[cell]
+            del bucket[key]
+            if not bucket:
+                del self.cells[cell]
+
+    def at(self, x, y):
+        return self.cells.get(self.cell_of(x, y), {})
+
+    def around(self, x, y, radius):
+        found = {}
+        for cell in self.cells_around(x, y, radius):
+            bucket = self.cells.get(cell)
+            if bucket:
+                found.update(bucket)
+        return found
+
+    def along(self, x0, y0, x1, y1):
+        # Всё, что лежит в ячейках прямоугольника отрезка (x0, y0) -> (x1, y1)
+        size = self.cell_size
+        col0, col1 = sorted((int(x0 // size), int(x1 // size)))
+        row0, row1 = sorted((int(y0 // size), int(y1 // size)))
+        if col0 == col1 and row0 == row1:
+            # Короткий отрезок обычно не выходит из ячейки — корзина без копии
+            return self.cells.get((col0, row0), {})
+        found = {}
+        for col in range(col0, col1 + 1):
+            for row in range(row0, row1 + 1):
+                bucket = self.cells.get((col, row))
+                if bucket:
+                    found.update(bucket)
+        return found
+
+    def __len__(self):
+        return len(self.keys)
@@ -0,0 +1,104 @@
+import json
+
+import msgpack
+
+from game.protocol import DIRECTIONS, DIRECTION_CODES
+
+SNAPSHOT_VERSION = 1
+
+
+def state_key(battle_id):
+    return f"battle:{battle_id}:state"
+
+
+def tiles_key(battle_id):
+    return f"battle:{battle_id}:tiles"
+
+
+def legacy_keys(battle_id):
+    return f"battle:{battle_id}:tanks", f"battle:{battle_id}:bullets"
+
+
+def tick_key(battle_id):
+    return f"battle:{battle_id}:tick"
+
+
+def lease_key(battle_id):
+    return f"battle:{battle_id}:engine"
+
+
+def battle_keys(battle_id):
+    # Всё состояние боя в Redis, кроме аренды движка; battle:{id}:map писали
+    # прежние версии, его только удаляем
+    return (
+        state_key(battle_id), *legacy_keys(battle_id), tiles_key(battle_id),
+        tick_key(battle_id), f"battle:{battle_id}:map"
+    )
+
+
+# Снимок боя — один msgpack-блоб вместо JSON на каждую сущность:
+# [версия, [[player_id, x, y, direction, is_alive, death_time], ...],
+#          [[id, shooter_id, x, y, direction], ...]]
+def pack_snapshot(tanks, bullets):
+    return msgpack.packb([
+        SNAPSHOT_VERSION,
+        [
+            [t['player_id'], t['x'], t['y'], DIRECTION_CODES.get(t['direction'], 0), t['is_alive'], t.get('death_time')]
+            for t in tanks.values()
+        ],
+        [
+            [b['id'], b['shooter_id'], b['x'], b['y'], DIRECTION_CODES.get(b['direction'], 0)]
+            for b in bullets.values()
+        ]
+    ])
+
+
+def unpack_snapshot(blob):
+    version, packed_tanks, packed_bullets = msgpack.unpackb(blob)
+    if version != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported battle snapshot version {version}")
+
+    tanks = {}
+    # Lua cmsgpack (скрипты ввода) не пишет завершающий nil, поэтому death_time может отсутствовать
+    for player_id, x, y, direction, is_alive, *rest in packed_tanks:
+        tank = {'player_id': player_id, 'x': x, 'y': y, 'direction': DIRECTIONS[direction], 'is_alive': is_alive}
+        if rest and rest[0] is not None:
+            tank['death_time'] = rest[0]
+        tanks[player_id] = tank
+    bullets = {}
+    for bullet_id, shooter_id, x, y, direction in packed_bullets:
+        bullets[bullet_id] = {
+            'id': bullet_id, 'shooter_id': shooter_id, 'x': x, 'y': y, 'direction': DIRECTIONS[direction]
+        }
+    return tanks, bullets
+
+
+def unpack_legacy(raw_tanks, raw_bullets):
+    # Старый формат: хэши battle:{id}:tanks и battle:{id}:bullets с JSON на сущность
+    tanks = {}
+    for raw in raw_tanks.values():
+        tank = json.loads(raw)
+        tanks[tank['player_id']] = tank
+    bullets = {}
+    for raw in raw_bullets.values():
+        bullet = json.loads(raw)
+        bullets[bullet['id']] = bullet
+    return tanks, bullets
+
+
+async def migrate_legacy_state(redis_client, battle_id):
+    # Переносит хэши старого формата в снимок; возвращает (tanks, bullets) или None
+    tanks_key, bullets_key = legacy_keys(battle_id)
+    async with redis_client.pipeline() as pipe:
+        await pipe.hgetall(tanks_key)
+        await pipe.hgetall(bullets_key)
+        raw_tanks, raw_bullets = await pipe.execute()
+    if not raw_tanks and not raw_bullets:
+        return None
+
+    tanks, bullets = unpack_legacy(raw_tanks, raw_bullets)
+    async with redis_client.pipeline() as pipe:
+        await pipe.set(state_key(battle_id), pack_snapshot(tanks, bullets))
+        await pipe.delete(tanks_key, bullets_key)
+        await pipe.execute()
+    return tanks, bullets
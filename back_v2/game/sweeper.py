@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import weakref
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.utils import timezone
+
+from game.redis_pool import get_redis
+from game.storage import battle_keys, lease_key
+from rooms.cache import invalidate_room_list
+from rooms.models import Room
+
+logger = logging.getLogger(__name__)
+
+SWEEP_LOCK_KEY = 'rooms:sweeper'
+
+# Периодическая чистка на event loop процесса, как и пул Redis
+_tasks = weakref.WeakKeyDictionary()
+
+
+def expire_rooms(now, batch_size):
+    # Деактивирует истекшие комнаты пачками по индексу (is_active, end_time),
+    # возвращает их battle_id
+    expired = []
+    while True:
+        batch = list(
+            Room.objects.filter(is_active=True, end_time__lt=now)
+            .order_by('end_time')
+            .values_list('id', 'battle_id')[:batch_size]
+        )
+        if not batch:
+            break
+        Room.objects.filter(id__in=[room_id for room_id, _ in batch]).update(is_active=False)
+        expired += [battle_id for _, battle_id in batch]
+    if expired:
+        invalidate_room_list()
+    return expired
+
+
+async def orphaned(redis, battle_ids):
+    # Бои без владельца: у живого движка аренда есть, и он закончит бой сам
+    async with redis.pipeline(transaction=False) as pipe:
+        for battle_id in battle_ids:
+            pipe.exists(lease_key(battle_id))
+        leased = await pipe.execute()
+    return [battle_id for battle_id, owned in zip(battle_ids, leased) if not owned]
+
+
+async def sweep(now=None, batch_size=None):
+    now = now or timezone.now()
+    batch_size = batch_size or settings.ROOM_SWEEP_BATCH
+    expired = await database_sync_to_async(expire_rooms)(now, batch_size)
+    redis = get_redis()
+    channel_layer = get_channel_layer()
+    swept = 0
+    for start in range(0, len(expired), batch_size):
+        battle_ids = await orphaned(redis, expired[start:start + batch_size])
+        for battle_id in battle_ids:
+            # Игроки могли остаться подключены к бою, чей движок уже умер
+            await channel_layer.group_send(
+                f'battle_{battle_id}',
+                {'type': 'game_event', 'data': {'event': 'game_over', 'reason': 'time_up'}}
+            )
+        if battle_ids:
+            await redis.delete(*(key for battle_id in battle_ids for key in battle_keys(battle_id)))
+        swept += len(battle_ids)
+    if expired:
+        logger.info(f"Expired {len(expired)} rooms, cleared Redis state of {swept}")
+    return len(expired), swept
+
+
+async def run_periodically(interval):
+    redis = get_redis()
+    while True:
+        try:
+            # За интервал чистит один процесс из всех, кто запустил цикл
+            if await redis.set(SWEEP_LOCK_KEY, 1, nx=True, px=int(interval * 1000)):
+                await sweep()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception(f"Room sweep failed: {e}")
+        await asyncio.sleep(interval)
+
+
+def start():
+    # Зовётся из процессов с боями; без них чистку запускает команда sweep_rooms
+    interval = settings.ROOM_SWEEP_INTERVAL
+    if not interval:
+        return
+    loop = asyncio.get_running_loop()
+    task = _tasks.get(loop)
+    if task is None or task.done():
+        _tasks[loop] = loop.create_task(run_periodically(interval))
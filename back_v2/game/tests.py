@@ -1,3 +1,1006 @@
-from django.test import TestCase
+import asyncio
+import copy
+import json
+import random
+import time
+from contextlib import asynccontextmanager
+from datetime import timedelta
+from unittest import mock, skipIf
 
-# Create your tests here.
+import fakeredis
+import msgpack
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from fakeredis.aioredis import FakeConnection
+from lupa.lua51 import LuaRuntime  # Та же версия Lua, что в Redis
+
+from game import engine
+from game.backends import MemoryStateBackend
+from game.inputs import InputQueue, TokenBucket
+from game.interest import InterestGrid
+from game import metrics
+from game.map_cache import MapCache, compiled_maps
+from game.maps import CompiledMap, TILE_SIZE
+from game.physics import MUZZLE_OFFSET, TANK_SIZE, TANK_SPEED, VECTORIZE_MAX_TANKS, Respawner, fire, move_tank, np, respawn_tanks, step_bullets, step_bullets_vectorized
+from game.outbox import Outbox
+from game.protocol import DIRECTION_CODES, DIRECTIONS, FrameEncoder, KEYFRAME_INTERVAL, apply_delta, decode_message, encode_message, merge_frames
+from game.redis_pool import MeteredConnectionPool, close_pool, get_pool, get_redis, pool_stats, set_pool
+from game.scheduler import SKIP, TickScheduler
+from game.scripts import MOVE_TANK_SCRIPT, SHOOT_SCRIPT
+from game.simulation import Simulation
+from game.storage import battle_keys, lease_key, pack_snapshot, unpack_legacy, unpack_snapshot
+from game.sweeper import expire_rooms, sweep
+from authenticator.models import CustomUser
+from rooms.cache import get_room_list, set_room_list
+from rooms.models import GameMap, Room
+
+TEST_OBSTACLES = (
+    'WWWWWWWWWWWW'
+    'WS   B    SW'
+    'W  B    B  W'
+    'W    WW    W'
+    'W  B    B  W'
+    'W    S     W'
+    'W S      S W'
+    'W          W'
+    'WWWWWWWWWWWW'
+)
+
+
+def make_map():
+    return CompiledMap('TestMap', 768, 576, TEST_OBSTACLES)
+
+
+class CompiledMapTests(SimpleTestCase):
+    def setUp(self):
+        self.game_map = make_map()
+
+    def brute_force_blocked(self, rect):
+        for idx, tile in enumerate(self.game_map.obstacles):
+            if tile not in ('W', 'B'):
+                continue
+            row, col = divmod(idx, self.game_map.cols)
+            if (rect['x'] < col * TILE_SIZE + TILE_SIZE and rect['x'] + rect['w'] > col * TILE_SIZE and
+                    rect['y'] < row * TILE_SIZE + TILE_SIZE and rect['y'] + rect['h'] > row * TILE_SIZE):
+                return True
+        return False
+
+    def test_is_blocked_matches_full_scan(self):
+        for x in range(-40, 800, 7):
+            for y in range(-40, 600, 7):
+                rect = {'x': x - 30, 'y': y - 30, 'w': 60, 'h': 60}
+                self.assertEqual(self.game_map.is_blocked(rect), self.brute_force_blocked(rect), rect)
+
+    def test_spawn_points(self):
+        self.assertEqual(len(self.game_map.spawn_points), 5)
+        self.assertIn({'x': 96, 'y': 96}, self.game_map.spawn_points)
+
+    def test_destroy_tile_clears_mask(self):
+        index = self.game_map.tile_index(5 * TILE_SIZE + 10, TILE_SIZE + 10)
+        self.assertEqual(self.game_map.tile_at(index), 'B')
+        rect = {'x': 5 * TILE_SIZE, 'y': TILE_SIZE, 'w': 60, 'h': 60}
+        self.assertTrue(self.game_map.is_blocked(rect))
+        self.game_map.destroy_tile(index)
+        self.assertEqual(self.game_map.tile_at(index), ' ')
+        self.assertFalse(self.game_map.is_blocked(rect))
+
+
+class BulletPhysicsTests(SimpleTestCase):
+    def setUp(self):
+        rng = random.Random(7)
+        self.tanks = {
+            str(i): {'player_id': i, 'x': rng.uniform(0, 768), 'y': rng.uniform(0, 576),
+                     'direction': 'up', 'is_alive': True}
+            for i in range(40)
+        }
+        self.bullets = {
+            str(i): {'id': str(i), 'shooter_id': 0, 'x': rng.uniform(0, 768), 'y': rng.uniform(0, 576),
+                     'direction': rng.choice(['up', 'down', 'left', 'right'])}
+            for i in range(500)
+        }
+
+    def test_spatial_hash_matches_full_scan(self):
+        scan = step_bullets(copy.deepcopy(self.bullets), copy.deepcopy(self.tanks), make_map(), 1.0, 0.01, spatial=False)
+        spatial = step_bullets(copy.deepcopy(self.bullets), copy.deepcopy(self.tanks), make_map(), 1.0, 0.01)
+        self.assertEqual(scan, spatial)
+        self.assertTrue(spatial[2])
+
+    def test_spatial_hash_matches_full_scan_at_low_tick_rate(self):
+        scan = step_bullets(copy.deepcopy(self.bullets), copy.deepcopy(self.tanks), make_map(), 1.0, 0.05, spatial=False)
+        spatial = step_bullets(copy.deepcopy(self.bullets), copy.deepcopy(self.tanks), make_map(), 1.0, 0.05)
+        self.assertEqual(scan, spatial)
+
+    def test_fast_bullet_does_not_pass_through_tank(self):
+        # 10 Гц: пуля за тик пролетает 100 px, конечная точка уже за танком
+        tanks = {'1': {'player_id': 1, 'x': 400, 'y': 480, 'direction': 'up', 'is_alive': True}}
+        bullets = {'b': {'id': 'b', 'shooter_id': 0, 'x': 330, 'y': 480, 'direction': 'right'}}
+        bullets, removed, hit_tanks, _ = step_bullets(bullets, tanks, make_map(), 1.0, 0.1)
+        self.assertEqual((bullets, removed, hit_tanks), ({}, ['b'], ['1']))
+        self.assertFalse(tanks['1']['is_alive'])
+
+    def test_fast_bullet_stops_at_nearest_obstacle(self):
+        game_map = make_map()
+        tanks = {'1': {'player_id': 1, 'x': 290, 'y': 160, 'direction': 'up', 'is_alive': True}}
+        bullets = {'b': {'id': 'b', 'shooter_id': 0, 'x': 170, 'y': 160, 'direction': 'right'}}
+        bullets, _, hit_tanks, destroyed = step_bullets(bullets, tanks, game_map, 1.0, 0.2)
+        self.assertEqual((bullets, hit_tanks, destroyed), ({}, [], [2 * 12 + 3]))
+        self.assertTrue(tanks['1']['is_alive'])
+        self.assertEqual(game_map.tile_at(2 * 12 + 3), ' ')
+
+    def test_bullet_travel_depends_on_time_not_ticks(self):
+        bullets = {'b': {'id': 'b', 'shooter_id': 0, 'x': 100.0, 'y': 480.0, 'direction': 'right'}}
+        for _ in range(5):
+            bullets, _, _, _ = step_bullets(bullets, {}, make_map(), 1.0, 0.02)
+        self.assertAlmostEqual(bullets['b']['x'], 200.0)
+
+    def test_dead_tank_respawns_without_bullets(self):
+        tank = self.tanks['0']
+        tank['is_alive'] = False
+        tank['death_time'] = 0.0
+        self.assertEqual(respawn_tanks(self.tanks, make_map(), 1.0), [])
+        self.assertEqual(respawn_tanks(self.tanks, make_map(), 2.5), ['0'])
+        self.assertTrue(tank['is_alive'])
+        self.assertNotIn('death_time', tank)
+
+
+@skipIf(np is None, "NumPy is not installed")
+class VectorizedBulletTests(SimpleTestCase):
+    def scenario(self, seed):
+        rng = random.Random(seed)
+        tanks = {
+            i: {'player_id': i, 'x': rng.uniform(0, 768), 'y': rng.uniform(0, 576),
+                'direction': 'up', 'is_alive': rng.random() > 0.1}
+            for i in range(30)
+        }
+        bullets = {}
+        for i in range(400):
+            bullets[i] = {'id': i, 'shooter_id': 0, 'x': rng.uniform(-10, 780), 'y': rng.uniform(-10, 590),
+                          'direction': rng.choice(['up', 'down', 'left', 'right'])}
+        # Очереди в один танк и в один кирпич: вторая пуля летит дальше
+        for i in range(400, 420):
+            bullets[i] = {'id': i, 'shooter_id': 0, 'x': 200 - i % 3, 'y': 160, 'direction': 'right'}
+        return tanks, bullets
+
+    def test_matches_scalar_path(self):
+        for seed in range(5):
+            for dt in (0.01, 1 / 60, 0.05, 0.2):
+                tanks, bullets = self.scenario(seed)
+                scalar_map, vector_map = make_map(), make_map()
+                scalar_tanks = copy.deepcopy(tanks)
+                scalar = step_bullets(copy.deepcopy(bullets), scalar_tanks, scalar_map, 1.0, dt, vectorized=False)
+                vector = step_bullets(bullets, tanks, vector_map, 1.0, dt, vectorized=True)
+                self.assertEqual(scalar, vector)
+                self.assertEqual(list(scalar[0]), list(vector[0]))
+                self.assertEqual(scalar_tanks, tanks)
+                self.assertEqual(scalar_map.obstacles, vector_map.obstacles)
+
+    def test_switches_above_threshold(self):
+        tanks, bullets = self.scenario(0)
+        self.assertEqual(
+            step_bullets(copy.deepcopy(bullets), copy.deepcopy(tanks), make_map(), 1.0, 0.01),
+            step_bullets(bullets, tanks, make_map(), 1.0, 0.01, vectorized=False)
+        )
+        self.assertEqual(step_bullets({}, tanks, make_map(), 1.0, 0.01, vectorized=True), ({}, [], [], []))
+
+    def test_crowded_battle_keeps_spatial_hash(self):
+        # Матрица пуля×танк при сотнях танков медленнее хэша, сколько бы ни было пуль
+        tanks, bullets = self.scenario(0)
+        crowd = {
+            i: {'player_id': i, 'x': 40 + i % 16 * 40, 'y': 40 + i // 16 * 30, 'direction': 'up', 'is_alive': True}
+            for i in range(VECTORIZE_MAX_TANKS)
+        }
+        with mock.patch('game.physics.step_bullets_vectorized', wraps=step_bullets_vectorized) as vectorized:
+            step_bullets(copy.deepcopy(bullets), tanks, make_map(), 1.0, 0.01)
+            self.assertEqual(vectorized.call_count, 1)
+            step_bullets(copy.deepcopy(bullets), crowd, make_map(), 1.0, 0.01)
+            self.assertEqual(vectorized.call_count, 1)
+            # Считаются только живые танки
+            crowd[0]['is_alive'] = False
+            step_bullets(bullets, crowd, make_map(), 1.0, 0.01)
+            self.assertEqual(vectorized.call_count, 2)
+
+class FrameEncoderTests(SimpleTestCase):
+    def setUp(self):
+        self.frames = FrameEncoder('battle')
+        self.tank = {'player_id': 1, 'x': 96, 'y': 96, 'direction': 'up', 'is_alive': True}
+        self.frames.advance([self.tank], [], 299)
+        self.keyframe = self.frames.keyframe(rebase=True)
+
+    def test_quiet_tick_sends_nothing(self):
+        self.assertIsNone(self.frames.advance([dict(self.tank)], [], 299))
+
+    def test_delta_contains_only_changes(self):
+        moved = dict(self.tank, y=101)
+        bullet = {'id': '1:1', 'shooter_id': 1, 'x': 96, 'y': 64, 'direction': 'up'}
+        frame = self.frames.advance([moved], [bullet], 299)
+        self.assertEqual(frame, {'tick': 2, 'base': 1, 'tanks': [moved], 'bullets': [bullet]})
+        frame = self.frames.advance([moved], [], 298)
+        self.assertEqual(frame, {'tick': 3, 'base': 2, 'removed_bullets': ['1:1'], 'time_left': 298})
+
+    def test_base_skips_quiet_ticks(self):
+        self.frames.advance([self.tank], [], 299)
+        frame = self.frames.advance([], [], 299)
+        self.assertEqual((frame['tick'], frame['base'], frame['removed_tanks']), (3, 1, [1]))
+
+    def test_keyframes(self):
+        self.assertEqual(self.keyframe['tanks'], [self.tank])
+        self.assertTrue(self.keyframe['keyframe'])
+        # Кадр одному игроку не сдвигает base для остальных
+        self.frames.advance([self.tank], [], 299)
+        self.frames.keyframe({'name': 'map'})
+        self.assertEqual(self.frames.advance([], [], 299)['base'], 1)
+        self.frames.tick = KEYFRAME_INTERVAL
+        self.assertTrue(self.frames.keyframe_due())
+
+
+class WireEncodingTests(SimpleTestCase):
+    def setUp(self):
+        rng = random.Random(3)
+        self.state = {
+            'tick': 10,
+            'base': 9,
+            'tanks': [{'player_id': i, 'x': rng.randint(0, 800), 'y': rng.randint(0, 600),
+                       'direction': 'left', 'is_alive': True} for i in range(50)],
+            'bullets': [{'id': f'{i % 50}:{1700000000000 + i}', 'shooter_id': i % 50, 'x': rng.randint(0, 800),
+                         'y': rng.randint(0, 600), 'direction': 'down'} for i in range(500)],
+        }
+
+    def test_json_is_default_text_frame(self):
+        text_data, bytes_data = encode_message('state', self.state, 'json')
+        self.assertIsNone(bytes_data)
+        self.assertEqual(decode_message(text_data), {'type': 'state', 'data': self.state})
+
+    def test_msgpack_frame_is_compact(self):
+        text_data, _ = encode_message('state', self.state, 'json')
+        _, bytes_data = encode_message('state', self.state, 'msgpack')
+        decoded = decode_message(bytes_data=bytes_data)
+        self.assertEqual(decoded['data']['tanks'][0], [0, self.state['tanks'][0]['x'], self.state['tanks'][0]['y'], 2, True])
+        self.assertEqual(decoded['data']['bullets'][0][4], 1)
+        self.assertLess(len(bytes_data) * 3, len(text_data))
+
+    def test_msgpack_input_accepts_direction_code(self):
+        self.assertEqual(decode_message(bytes_data=msgpack.packb({'action': 'move', 'direction': 3})),
+                         {'action': 'move', 'direction': 'right'})
+
+
+class SnapshotStorageTests(SimpleTestCase):
+    def setUp(self):
+        self.tanks = {
+            1: {'player_id': 1, 'x': 96, 'y': 101, 'direction': 'down', 'is_alive': True},
+            2: {'player_id': 2, 'x': 608, 'y': 416, 'direction': 'left', 'is_alive': False, 'death_time': 1700000000.5},
+        }
+        self.bullets = {
+            '1:1700000000000': {'id': '1:1700000000000', 'shooter_id': 1, 'x': 96, 'y': 150, 'direction': 'down'},
+        }
+
+    def test_snapshot_round_trip(self):
+        self.assertEqual(unpack_snapshot(pack_snapshot(self.tanks, self.bullets)), (self.tanks, self.bullets))
+
+    def test_unknown_version_rejected(self):
+        with self.assertRaises(ValueError):
+            unpack_snapshot(msgpack.packb([99, [], []]))
+
+    def test_legacy_hashes_are_readable(self):
+        raw_tanks = {str(k).encode(): json.dumps(v) for k, v in self.tanks.items()}
+        raw_bullets = {k.encode(): json.dumps(v) for k, v in self.bullets.items()}
+        self.assertEqual(unpack_legacy(raw_tanks, raw_bullets), (self.tanks, self.bullets))
+
+    def test_snapshot_written_by_lua_is_readable(self):
+        # cmsgpack в Lua-скриптах отбрасывает завершающий nil у живого танка
+        blob = msgpack.packb([1, [[1, 96, 101, 1, True], [2, 608, 416, 2, False, 1700000000.5]], []])
+        self.assertEqual(unpack_snapshot(blob), (self.tanks, {}))
+
+
+class LuaRedis:
+    # Окружение скриптов Redis в миниатюре: KEYS, ARGV, redis.call для GET, SET
+    # и GETRANGE над словарём и cmsgpack поверх msgpack. В fakeredis нет cmsgpack,
+    # а настоящий Redis в тестах не нужен
+    def __init__(self):
+        self.data = {}
+        self.lua = LuaRuntime(encoding=None)
+        self.lua.globals().redis = self.lua.table_from({
+            b'call': self.call,
+            b'error_reply': lambda message: self.lua.table_from({b'err': message}),
+        })
+        self.lua.globals().cmsgpack = self.lua.table_from({
+            b'pack': lambda table: msgpack.packb(self.to_python(table)),
+            b'unpack': lambda blob: self.to_lua(msgpack.unpackb(blob)),
+        })
+
+    def call(self, command, key, *args):
+        command = command.decode().lower()
+        if command == 'get':
+            return self.data.get(key)
+        if command == 'set':
+            self.data[key] = args[0]
+            return True
+        if command == 'getrange':
+            return self.data[key][int(args[0]):int(args[1]) + 1]
+        raise ValueError(f"Unexpected command {command}")
+
+    def to_lua(self, value):
+        # Как cmsgpack: nil в массиве не хранится, строки — байты Lua
+        if isinstance(value, list):
+            return self.lua.table_from({i + 1: self.to_lua(item) for i, item in enumerate(value) if item is not None})
+        return value.encode() if isinstance(value, str) else value
+
+    def to_python(self, value):
+        if value is None or isinstance(value, (bool, int, float, bytes)):
+            if isinstance(value, float) and value.is_integer():
+                return int(value)  # Числа Lua — double; cmsgpack пишет целые как int
+            return value.decode() if isinstance(value, bytes) else value
+        return [self.to_python(value[i]) for i in range(1, len(value) + 1)]
+
+    def eval(self, script, keys, args):
+        self.lua.globals().KEYS = self.lua.table_from([key.encode() for key in keys])
+        self.lua.globals().ARGV = self.lua.table_from([str(arg).encode() for arg in args])
+        return self.lua.execute(script)
+
+
+class LuaScriptTests(SimpleTestCase):
+    # Скрипты ввода RedisStateBackend должны двигать и стрелять так же, как game.physics
+    def setUp(self):
+        self.game_map = CompiledMap('TestMap', 768, 576, TEST_OBSTACLES)
+        self.redis = LuaRedis()
+        self.redis.data[b'tiles'] = TEST_OBSTACLES.encode()
+        self.rng = random.Random(1)
+
+    def random_tanks(self):
+        tanks = {}
+        for player_id in range(1, self.rng.randint(1, 4) + 1):
+            tanks[player_id] = {
+                'player_id': player_id, 'x': self.rng.randint(0, 768), 'y': self.rng.randint(0, 576),
+                'direction': self.rng.choice(DIRECTIONS), 'is_alive': True,
+            }
+            if self.rng.random() < 0.3:
+                tanks[player_id].update(is_alive=False, death_time=1700000000.5)
+        return tanks
+
+    def test_move_matches_physics(self):
+        for _ in range(2000):
+            tanks = self.random_tanks()
+            player_id, direction = self.rng.choice(list(tanks)), self.rng.choice(DIRECTIONS)
+            self.redis.data[b'state'] = pack_snapshot(tanks, {})
+            steps = self.rng.randint(1, 4)
+            self.redis.eval(MOVE_TANK_SCRIPT, ['state', 'tiles'], [
+                player_id, DIRECTION_CODES[direction], TANK_SPEED, TANK_SIZE // 2, self.game_map.width,
+                self.game_map.height, self.game_map.cols, self.game_map.rows, TILE_SIZE, steps
+            ])
+            for _ in range(steps):
+                move_tank(tanks[player_id], direction, self.game_map)
+            self.assertEqual(unpack_snapshot(self.redis.data[b'state']), (tanks, {}))
+
+    def test_shoot_matches_physics(self):
+        for index in range(500):
+            tanks = self.random_tanks()
+            player_id = self.rng.choice(list(tanks))
+            bullets = {'0:1': fire(tanks[1], '0:1')}
+            self.redis.data[b'state'] = pack_snapshot(tanks, bullets)
+            self.redis.eval(SHOOT_SCRIPT, ['state', 'tiles'], [player_id, f'{player_id}:{index}', MUZZLE_OFFSET])
+            bullets[f'{player_id}:{index}'] = fire(tanks[player_id], f'{player_id}:{index}')
+            self.assertEqual(unpack_snapshot(self.redis.data[b'state']), (tanks, bullets))
+
+    def test_unknown_player_is_ignored(self):
+        tanks = self.random_tanks()
+        blob = self.redis.data[b'state'] = pack_snapshot(tanks, {})
+        self.assertEqual(self.redis.eval(SHOOT_SCRIPT, ['state', 'tiles'], [99, '99:1', MUZZLE_OFFSET]), 0)
+        self.assertIs(self.redis.data[b'state'], blob)
+
+
+class RedisPoolTests(SimpleTestCase):
+    @override_settings(REDIS_POOL_SIZE=7)
+    async def test_clients_share_one_pool(self):
+        pool = get_pool()
+        self.assertIs(get_redis().connection_pool, pool)
+        self.assertIs(get_redis().connection_pool, pool)
+        connection = pool.get_available_connection()  # Без подключения к серверу
+        self.assertEqual(pool_stats()['in_use'], 1)
+        await pool.release(connection)
+        self.assertEqual(pool_stats(), {'max_connections': 7, 'in_use': 0, 'idle': 1, 'peak_in_use': 0, 'exhausted': 0})
+        await close_pool()
+        self.assertIsNot(get_pool(), pool)
+        await close_pool()
+
+
+class MemoryStateBackendTests(SimpleTestCase):
+    def setUp(self):
+        # Без Redis: снимок в этих тестах не пишется
+        self.state = MemoryStateBackend('battle', None, make_map(), snapshot_interval=1000)
+
+    async def test_inputs_change_state_in_place(self):
+        tank = await self.state.create_tank(1)
+        self.assertIsNone(await self.state.create_tank(1))
+        x, y = tank['x'], tank['y']
+        await self.state.move(1, 'down')
+        self.assertEqual((tank['x'], tank['y'], tank['direction']), (x, y + 5, 'down'))
+        await self.state.shoot(1, '1:1')
+        self.assertEqual(self.state.simulation.bullets['1:1']['y'], y + 5 + 32)
+
+    async def test_tick_returns_copies(self):
+        await self.state.create_tank(1)
+        await self.state.shoot(1, '1:1')
+        tanks, bullets, _ = await self.state.tick(1.0, 0.01)
+        first = copy.deepcopy(bullets)
+        await self.state.move(1, 'left')
+        await self.state.tick(1.01, 0.01)
+        self.assertEqual(bullets, first)
+        self.assertIsNot(tanks[1], self.state.simulation.tanks[1])
+
+
+class SimulationTests(SimpleTestCase):
+    def test_shot_kills_and_tank_respawns(self):
+        simulation = Simulation(make_map())
+        simulation.tanks[1] = {'player_id': 1, 'x': 288, 'y': 480, 'direction': 'right', 'is_alive': True}
+        simulation.tanks[2] = {'player_id': 2, 'x': 416, 'y': 480, 'direction': 'left', 'is_alive': True}
+        self.assertFalse(simulation.apply_inputs([(3, 'up', 1, True)], 1.0))
+        self.assertTrue(simulation.apply_inputs([(1, None, 0, True)], 1.0))
+
+        now = 1.0
+        hit_tanks = []
+        while not hit_tanks:
+            respawned, hit_tanks, destroyed = simulation.step(now, 0.05)
+            now += 0.05
+        self.assertEqual((respawned, hit_tanks, destroyed, simulation.bullets), ([], [2], [], {}))
+        self.assertEqual(simulation.step(now + 2.0, 0.05), ([2], [], []))
+        self.assertTrue(simulation.tanks[2]['is_alive'])
+
+    def test_join_and_leave(self):
+        simulation = Simulation(make_map())
+        tank = simulation.join(1)
+        self.assertIn({'x': tank['x'], 'y': tank['y']}, simulation.game_map.spawn_points)
+        self.assertIsNone(simulation.join(1))
+        self.assertTrue(simulation.leave(1))
+        self.assertFalse(simulation.leave(1))
+
+
+class MetricsTests(SimpleTestCase):
+    def tearDown(self):
+        metrics.forget('b1')
+
+    def test_render_prometheus_text(self):
+        battle = metrics.battle('b1')
+        battle.phases['physics'].observe(0.0003)
+        battle.phases['physics'].observe(0.02)
+        battle.count('outbound_bytes', 120)
+        battle.gauges['tanks'] = 2
+        battle.scheduler = TickScheduler(tick_rate=100, broadcast_rate=100)
+        text = metrics.render()
+        self.assertIn('battle_phase_seconds_bucket{battle="b1",phase="physics",le="0.0005"} 1', text)
+        self.assertIn('battle_phase_seconds_bucket{battle="b1",phase="physics",le="+Inf"} 2', text)
+        self.assertIn('battle_phase_seconds_count{battle="b1",phase="physics"} 2', text)
+        self.assertNotIn('phase="read"', text)
+        self.assertIn('battle_outbound_bytes_total{battle="b1"} 120', text)
+        self.assertIn('battle_tanks{battle="b1"} 2', text)
+        self.assertIn('battle_ticks_total{battle="b1"} 0', text)
+        self.assertIn('# TYPE redis_pool_in_use gauge', text)
+
+    def test_endpoint_is_local_only(self):
+        metrics.battle('b1').count('inputs')
+        response = self.client.get('/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('battle_inputs_total{battle="b1"} 1', response.content.decode())
+        self.assertEqual(self.client.get('/metrics/', REMOTE_ADDR='10.0.0.1').status_code, 403)
+
+    @override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+    async def test_rejected_connect_leaves_no_series(self):
+        from back_v2.asgi import application
+
+        for battle_id in ('b1', 'b2'):
+            communicator = WebsocketCommunicator(application, f'/ws/battle/{battle_id}/?token=bad')
+            connected, _ = await communicator.connect()
+            self.assertFalse(connected)
+        output = metrics.render()
+        self.assertNotIn('battle="b1"', output)
+        self.assertNotIn('battle="b2"', output)
+
+
+class InputQueueTests(SimpleTestCase):
+    def test_inputs_coalesce_per_tick(self):
+        queue = InputQueue(shot_cooldown=0.25)
+        for _ in range(10):
+            queue.push(1, 'move', 'up')
+        queue.push(1, 'move', 'left')
+        queue.push(1, 'shoot')
+        queue.push(1, 'shoot')
+        queue.push(2, 'move', 'down')
+        queue.push(2, 'move', 'down')
+        self.assertEqual(queue.drain(1.0), [(1, 'left', 1, True), (2, 'down', 2, False)])
+        self.assertEqual(queue.drain(1.01), [])
+
+    def test_speed_does_not_depend_on_tick_rate(self):
+        # Ввод ~30 сообщений в секунду: за секунду танк проходит одно и то же при 10 и 100 Гц
+        distances = []
+        for tick_rate in (10, 100):
+            simulation = Simulation(make_map())
+            simulation.tanks[1] = {'player_id': 1, 'x': 96, 'y': 96, 'direction': 'down', 'is_alive': True}
+            queue = InputQueue(shot_cooldown=0.25)
+            for tick in range(tick_rate):
+                now = tick / tick_rate
+                # Сообщения, пришедшие до границы этого тика
+                for _ in range((tick + 1) * 30 // tick_rate - tick * 30 // tick_rate):
+                    queue.push(1, 'move', 'right')
+                simulation.apply_inputs(queue.drain(now), now)
+            distances.append(simulation.tanks[1]['x'] - 96)
+        self.assertEqual(distances, [150, 150])
+
+    def test_shot_cooldown(self):
+        queue = InputQueue(shot_cooldown=0.25)
+        shots = []
+        for tick in range(100):
+            queue.push(1, 'shoot')
+            shots.extend(queue.drain(tick * 0.01))
+        self.assertEqual(len(shots), 4)
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(rate=10, burst=5, now=0.0)
+        self.assertEqual(sum(bucket.take(0.0) for _ in range(8)), 5)
+        self.assertEqual(bucket.dropped, 3)
+        self.assertTrue(bucket.take(0.1))
+        self.assertFalse(bucket.take(0.1))
+
+
+class TickSchedulerTests(SimpleTestCase):
+    def test_ticks_stay_on_grid(self):
+        scheduler = TickScheduler(tick_rate=60, broadcast_rate=20)
+        scheduler.start(0.0)
+        broadcasts = 0
+        now = 0.0
+        while now < 1.0:
+            steps, broadcast = scheduler.advance(now)
+            broadcasts += broadcast
+            # Работа тика занимает разное время, сон — до следующего срока
+            now += scheduler.delay(now) + 0.003
+        self.assertEqual((scheduler.ticks, broadcasts, scheduler.overruns), (60, 20, 0))
+
+    def test_catch_up_and_skip(self):
+        scheduler = TickScheduler(tick_rate=100, broadcast_rate=100, max_catch_up=5)
+        scheduler.start(0.0)
+        self.assertEqual(scheduler.advance(0.0), (1, True))
+        self.assertEqual(scheduler.advance(0.035), (3, True))
+        self.assertEqual(scheduler.advance(0.2), (5, True))
+        self.assertEqual((scheduler.overruns, scheduler.skipped), (2, 12))
+        self.assertAlmostEqual(scheduler.delay(0.2), 0.01)
+
+        scheduler = TickScheduler(tick_rate=100, broadcast_rate=100, policy=SKIP)
+        scheduler.start(0.0)
+        scheduler.advance(0.0)
+        self.assertEqual(scheduler.advance(0.035), (1, True))
+        self.assertEqual(scheduler.skipped, 2)
+
+
+class FrameMergeTests(SimpleTestCase):
+    def setUp(self):
+        rng = random.Random(11)
+        self.frames = FrameEncoder('battle')
+        self.sent = []
+        tanks = {i: {'player_id': i, 'x': 96, 'y': 96, 'direction': 'up', 'is_alive': True} for i in range(6)}
+        bullets = {}
+        for tick in range(60):
+            for tank in tanks.values():
+                tank['y'] += rng.choice((0, 0, 5))
+            if rng.random() < 0.3:
+                bullets[f'b{tick}'] = {'id': f'b{tick}', 'shooter_id': 0, 'x': 0, 'y': 0, 'direction': 'up'}
+            for bullet_id in [b for b in bullets if rng.random() < 0.2]:
+                del bullets[bullet_id]
+            if tick == 30:
+                tanks.pop(5)
+            frame = self.frames.advance(copy.deepcopy(list(tanks.values())), copy.deepcopy(list(bullets.values())), 60 - tick)
+            if self.frames.keyframe_due():
+                frame = self.frames.keyframe(rebase=True)
+            if frame:
+                self.sent.append(frame)
+        self.final = (tanks, bullets)
+
+    def replay(self, frames):
+        state = None
+        for frame in frames:
+            if not frame.get('keyframe'):
+                self.assertLessEqual(frame['base'], state['tick'])
+            state = frame if frame.get('keyframe') else apply_delta(state, frame)
+        return {t['player_id']: t for t in state['tanks']}, {b['id']: b for b in state['bullets']}
+
+    def test_merged_frames_give_same_state(self):
+        self.assertEqual(self.replay(self.sent), self.final)
+        first, rest = self.sent[0], self.sent[1:]
+        for group in (2, 3, 7):
+            merged = [first]
+            for start in range(0, len(rest), group):
+                frame = rest[start]
+                for newer in rest[start + 1:start + group]:
+                    frame = merge_frames(frame, newer)
+                merged.append(frame)
+            self.assertEqual(self.replay(merged), self.final, group)
+
+    def test_keyframe_absorbs_deltas(self):
+        frame = self.sent[0]
+        for newer in self.sent[1:]:
+            frame = merge_frames(frame, newer)
+        self.assertTrue(frame['keyframe'])
+        self.assertEqual(self.replay([frame]), self.final)
+
+    async def test_outbox_keeps_events_and_latest_state(self):
+        delivered = []
+        release = asyncio.Event()
+
+        async def slow_send(message_type, data):
+            delivered.append((message_type, data))
+            await release.wait()
+
+        outbox = Outbox(slow_send, max_events=2)
+        task = asyncio.create_task(outbox.run())
+        outbox.put_state(self.sent[0])
+        await asyncio.sleep(0)
+        for frame in self.sent[1:]:
+            outbox.put_state(frame)
+        self.assertTrue(outbox.put_event({'event': 'tiles'}))
+        self.assertTrue(outbox.put_event({'event': 'game_over'}))
+        self.assertFalse(outbox.put_event({'event': 'extra'}))
+        release.set()
+        await asyncio.sleep(0.01)
+        task.cancel()
+
+        self.assertEqual([message_type for message_type, _ in delivered], ['state', 'event', 'event', 'state'])
+        self.assertEqual(outbox.dropped_frames, len(self.sent) - 2)
+        self.assertEqual(self.replay([delivered[0][1], delivered[3][1]]), self.final)
+
+    async def test_pending_map_includes_later_destruction(self):
+        delivered = []
+
+        async def send(message_type, data):
+            delivered.append((message_type, data))
+
+        outbox = Outbox(send)
+        game_map = make_map()
+        index = game_map.tile_index(5 * TILE_SIZE + 10, TILE_SIZE + 10)
+        outbox.put_state(self.frames.keyframe(game_map.to_data()))
+        outbox.put_event({'event': 'tiles', 'tick': 11, 'tiles': [{'index': index, 'tile': ' '}]})
+        # Ключевой кадр без карты сливается с ждущим и несёт её дальше
+        outbox.put_state(self.frames.keyframe())
+        task = asyncio.create_task(outbox.run())
+        await asyncio.sleep(0.01)
+        task.cancel()
+
+        self.assertEqual([message_type for message_type, _ in delivered], ['event', 'state'])
+        self.assertEqual(delivered[1][1]['map']['obstacles'][index], ' ')
+        self.assertEqual(game_map.tile_at(index), 'B')
+
+
+class InterestGridTests(SimpleTestCase):
+    def test_window_of_tiles(self):
+        tanks = {
+            1: {'player_id': 1, 'x': 96, 'y': 96},
+            2: {'player_id': 2, 'x': 96 + 2 * TILE_SIZE, 'y': 96 + 2 * TILE_SIZE},
+            3: {'player_id': 3, 'x': 96 + 3 * TILE_SIZE, 'y': 96},
+        }
+        bullets = {'a': {'id': 'a', 'x': 100, 'y': 200}, 'b': {'id': 'b', 'x': 700, 'y': 500}}
+        grid = InterestGrid(tanks, bullets)
+        view_tanks, view_bullets = grid.visible(96, 96, 2)
+        self.assertEqual(sorted(tank['player_id'] for tank in view_tanks), [1, 2])
+        self.assertEqual([bullet['id'] for bullet in view_bullets], ['a'])
+        view_tanks, _ = grid.visible(96, 96, 3)
+        self.assertEqual(len(view_tanks), 3)
+
+
+
+class EngineViewTests(SimpleTestCase):
+    # send_game_state с зоной видимости, без Redis и слоя каналов: кадры,
+    # которые движок отправляет каждому игроку
+    def setUp(self):
+        self.engine = engine.BattleEngine('views')
+        self.engine.room = mock.Mock(end_time=timezone.now() + timedelta(minutes=5))
+        self.engine.redis = mock.AsyncMock()
+        self.engine.channel_layer = mock.AsyncMock()
+        self.engine.game_map = make_map()
+        self.engine.map_changed = False
+        self.engine.view_tiles = 2
+        self.engine.frames = FrameEncoder('views', 0, 10)
+        self.engine.players = {1: 'one', 2: 'two'}
+        self.tanks = {1: self.tank(1, 96, 96), 2: self.tank(2, 96 + TILE_SIZE, 96)}
+
+    def tearDown(self):
+        metrics.forget('views')
+
+    def tank(self, player_id, x, y):
+        return {'player_id': player_id, 'x': x, 'y': y, 'direction': 'up', 'is_alive': True}
+
+    async def broadcast(self):
+        self.engine.channel_layer.send.reset_mock()
+        await self.engine.send_game_state(dict(self.tanks), {})
+        return {call.args[0]: call.args[1]['data'] for call in self.engine.channel_layer.send.call_args_list}
+
+    async def test_entity_leaving_view_is_removed(self):
+        frames = await self.broadcast()
+        self.assertEqual(sorted(tank['player_id'] for tank in frames['one']['tanks']), [1, 2])
+        self.tanks[2] = self.tank(2, 96 + 6 * TILE_SIZE, 96)
+        frames = await self.broadcast()
+        self.assertEqual(frames['one']['removed_tanks'], [2])
+        self.assertNotIn('tanks', frames['one'])
+        self.assertEqual(frames['two']['removed_tanks'], [1])
+        self.assertEqual(frames['two']['tanks'], [self.tanks[2]])
+
+    async def test_resync_sends_keyframe_with_map(self):
+        frames = await self.broadcast()
+        self.assertTrue(all('map' in frame for frame in frames.values()))
+        self.tanks[1] = self.tank(1, 100, 96)
+        frames = await self.broadcast()
+        self.assertNotIn('keyframe', frames['one'])
+        self.engine.pending_keyframes.add('one')
+        frames = await self.broadcast()
+        self.assertTrue(frames['one']['keyframe'])
+        self.assertEqual(frames['one']['map'], self.engine.game_map.to_data())
+        self.assertNotIn('map', frames.get('two', {}))
+
+    async def test_view_ticks_follow_group(self):
+        received = {'one': [], 'two': []}
+        for step in range(25):
+            self.tanks[1] = self.tank(1, 96 + step, 96)
+            for channel_name, frame in (await self.broadcast()).items():
+                self.assertEqual(frame['tick'], self.engine.frames.tick)
+                received[channel_name].append(frame)
+        # Ключевые кадры зоны видимости — на тех же тиках, что у группы
+        keyframe_ticks = [frame['tick'] for frame in received['one'] if frame.get('keyframe')]
+        self.assertEqual(keyframe_ticks, [1, 10, 20])
+        state = received['one'][0]
+        for frame in received['one'][1:]:
+            if not frame.get('keyframe'):
+                self.assertLessEqual(frame['base'], state['tick'])
+            state = frame if frame.get('keyframe') else apply_delta(state, frame)
+        self.assertEqual(state['tanks'], [self.tanks[1], self.tanks[2]])
+
+@override_settings(CACHES=settings.LOCAL_CACHES)
+class MapCacheTests(TestCase):
+    def setUp(self):
+        self.game_map = GameMap.objects.create(name='TestMap', width=768, height=576, obstacles=TEST_OBSTACLES)
+
+    def test_lru_by_id_and_version(self):
+        cache = MapCache(maxsize=1)
+        compiled = cache.get(self.game_map)
+        self.assertIs(cache.get(self.game_map), compiled)
+        self.assertEqual(cache.stats(), {'size': 1, 'hits': 1, 'misses': 1})
+
+        other = GameMap.objects.create(name='Other', width=128, height=128, obstacles='S   ')
+        cache.get(other)
+        self.assertIsNot(cache.get(self.game_map), compiled)
+        self.assertEqual(cache.stats(), {'size': 1, 'hits': 1, 'misses': 3})
+
+    def test_battle_copy_is_independent(self):
+        compiled = compiled_maps.get(self.game_map)
+        battle_map = compiled.copy()
+        index = battle_map.tile_index(5 * TILE_SIZE + 10, TILE_SIZE + 10)
+        battle_map.destroy_tile(index)
+        self.assertEqual(compiled.tile_at(index), 'B')
+        self.assertEqual(compiled.solid[index], 1)
+        restored = compiled.copy(battle_map.obstacles)
+        self.assertEqual(restored.solid, battle_map.solid)
+        self.assertIs(restored.spawn_points, compiled.spawn_points)
+
+    def test_edit_invalidates(self):
+        compiled_maps.get(self.game_map)
+        self.game_map.obstacles = TEST_OBSTACLES.replace('B', ' ')
+        self.game_map.save()
+        self.assertEqual(self.game_map.version, 2)
+        self.assertNotIn((self.game_map.id, 1), compiled_maps.maps)
+        self.assertNotIn('B', compiled_maps.get(self.game_map).obstacles)
+
+
+@override_settings(CACHES=settings.LOCAL_CACHES)
+class SweeperTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(username='sweeper', password='x', nickname='Sweeper')
+        self.game_map = GameMap.objects.create(name='TestMap', width=768, height=576, obstacles=TEST_OBSTACLES)
+
+    def room(self, minutes):
+        return Room.objects.create(
+            creator=self.user, map_name=self.game_map, end_time=timezone.now() + timedelta(minutes=minutes)
+        )
+
+    def test_expires_in_batches(self):
+        expired = [self.room(-minutes) for minutes in (1, 2, 3)]
+        live = self.room(5)
+        set_room_list([], 60)
+        with self.assertNumQueries(5):  # Пачки по две: выборка и UPDATE, в конце пустая выборка
+            battle_ids = expire_rooms(timezone.now(), batch_size=2)
+        self.assertEqual(sorted(battle_ids), sorted(room.battle_id for room in expired))
+        self.assertFalse(Room.objects.filter(id__in=[room.id for room in expired], is_active=True).exists())
+        live.refresh_from_db()
+        self.assertTrue(live.is_active)
+        self.assertIsNone(get_room_list())
+
+    def test_nothing_to_expire(self):
+        self.room(5)
+        set_room_list([], 60)
+        self.assertEqual(expire_rooms(timezone.now(), batch_size=2), [])
+        self.assertEqual(get_room_list(), [])
+
+    @override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+    async def test_sweep_ends_orphaned_battles(self):
+        room = database_sync_to_async(self.room)
+        orphan, owned, live = [(await room(minutes)).battle_id for minutes in (-1, -2, 5)]
+        set_pool(MeteredConnectionPool(connection_class=FakeConnection, server=fakeredis.FakeServer()))
+        try:
+            redis = get_redis()
+            for battle_id in (orphan, owned, live):
+                for key in battle_keys(battle_id):
+                    await redis.set(key, 1)
+            # У второго боя движок жив: он сам закончит бой и уберёт ключи
+            await redis.set(lease_key(owned), 'token')
+            layer = get_channel_layer()
+            channels = {}
+            for battle_id in (orphan, owned):
+                channels[battle_id] = await layer.new_channel()
+                await layer.group_add(f'battle_{battle_id}', channels[battle_id])
+
+            self.assertEqual(await sweep(batch_size=1), (2, 1))
+            self.assertEqual(await redis.exists(*battle_keys(orphan)), 0)
+            self.assertEqual(await redis.exists(*battle_keys(owned)), len(battle_keys(owned)))
+            self.assertEqual(await redis.exists(*battle_keys(live)), len(battle_keys(live)))
+            self.assertEqual(await redis.get(lease_key(owned)), b'token')
+
+            message = await layer.receive(channels[orphan])
+            self.assertEqual(message['data'], {'event': 'game_over', 'reason': 'time_up'})
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(layer.receive(channels[owned]), 0.05)
+        finally:
+            await close_pool()
+
+
+@override_settings(
+    CACHES=settings.LOCAL_CACHES, ROOM_SWEEP_INTERVAL=None,
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+)
+@mock.patch.multiple(engine, LEASE_TTL_MS=300, LEASE_RENEW_INTERVAL=0.05, LEASE_RETRY_INTERVAL=0.05)
+class EngineLeaseTests(TestCase):
+    # Несколько движков одного боя в одном процессе — как воркеры daphne,
+    # у которых общие Redis (fakeredis) и слой каналов
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='engine', password='x', nickname='Engine')
+        game_map = GameMap.objects.create(name='TestMap', width=768, height=576, obstacles=TEST_OBSTACLES)
+        self.room = Room.objects.create(creator=self.user, map_name=game_map, max_players=4)
+        self.battle_id = str(self.room.battle_id)
+
+    @asynccontextmanager
+    async def fake_redis(self):
+        # TestCase не зовёт asyncSetUp: пул и остановка движков — на event loop самого теста
+        set_pool(MeteredConnectionPool(connection_class=FakeConnection, server=fakeredis.FakeServer()))
+        self.engines = []
+        try:
+            yield
+        finally:
+            for item in self.engines:
+                item.stop()
+            await asyncio.gather(*(item.task for item in self.engines if item.task), return_exceptions=True)
+            await close_pool()
+            # Движки не из attach() своих метрик не забывают
+            metrics.forget(self.battle_id)
+
+    async def wait_for(self, condition, timeout=2.0):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            self.assertLess(time.monotonic(), deadline, "condition not reached")
+            await asyncio.sleep(0.01)
+
+    def start(self):
+        item = engine.BattleEngine(self.battle_id)
+        item.start()
+        self.engines.append(item)
+        return item
+
+    async def join(self, item):
+        # Как BattleConsumer.forward: канал игрока в группе комнаты, вход — группе движка
+        channel = await item.channel_layer.new_channel()
+        await item.channel_layer.group_add(item.room_group_name, channel)
+        await item.channel_layer.group_send(
+            item.engine_group_name, {'type': 'player_join', 'player_id': self.user.id, 'reply_channel': channel}
+        )
+        return channel
+
+    async def test_one_engine_ticks_per_battle(self):
+        async with self.fake_redis():
+            first, second = self.start(), self.start()
+            await self.wait_for(lambda: first.is_owner or second.is_owner)
+            owner, standby = (first, second) if first.is_owner else (second, first)
+            await self.wait_for(lambda: owner.scheduler.ticks > 20)
+            self.assertFalse(standby.is_owner)
+            self.assertIsNone(standby.scheduler)
+
+    async def test_standby_takes_over_after_lease_expires_with_tanks(self):
+        async with self.fake_redis():
+            owner = self.start()
+            await self.wait_for(lambda: owner.is_owner)
+            channel = await self.join(owner)
+            await self.wait_for(lambda: self.user.id in owner.state.simulation.tanks)
+            tank = dict(owner.state.simulation.tanks[self.user.id])
+            await self.wait_for(lambda: owner.state.ticks >= owner.state.snapshot_interval)
+            standby = self.start()
+            await asyncio.sleep(0.1)
+            self.assertFalse(standby.is_owner)
+
+            # Процесс владельца умер: аренду никто не отпускает, она истекает сама
+            owner.resign = mock.AsyncMock()
+            owner.stop()
+            await self.wait_for(lambda: standby.is_owner)
+            self.assertEqual(standby.state.simulation.tanks[self.user.id]['x'], tank['x'])
+            self.assertEqual(standby.state.simulation.tanks[self.user.id]['y'], tank['y'])
+
+            # Игроки в группе комнаты узнают о новом владельце и входят заново
+            while (await owner.channel_layer.receive(channel))['type'] != 'engine_elected':
+                pass
+
+    async def test_flush_only_while_holding_lease(self):
+        async with self.fake_redis():
+            owner = self.start()
+            await self.wait_for(lambda: owner.is_owner)
+            await self.join(owner)
+            await self.wait_for(lambda: self.user.id in owner.state.simulation.tanks)
+            # Аренду уже забрал другой: последний снимок прежнего владельца не пишется
+            await owner.redis.set(owner.lease_key, 'other')
+            owner.state.flush = mock.AsyncMock()
+            owner.stop()
+            await self.wait_for(lambda: not owner.is_owner)
+            owner.state.flush.assert_not_called()
+            self.assertEqual(await owner.redis.get(owner.lease_key), b'other')
+
+    async def test_attach_after_stop_starts_new_engine(self):
+        async with self.fake_redis():
+            first = engine.attach(self.battle_id)
+            await self.wait_for(lambda: first.is_owner)
+            engine.detach(self.battle_id)
+            # Единственный игрок обновил страницу, пока движок ещё не доработал finally
+            second = engine.attach(self.battle_id)
+            self.assertIsNot(second, first)
+            self.assertTrue(second.running)
+            await self.wait_for(lambda: first.task.done())
+            self.assertIs(engine._engines.get(self.battle_id), second)
+            await self.wait_for(lambda: second.is_owner)
+            engine.detach(self.battle_id)
+            await self.wait_for(lambda: self.battle_id not in engine._engines)
+
+
+class RespawnerTests(SimpleTestCase):
+    def setUp(self):
+        self.game_map = make_map()
+        self.state = MemoryStateBackend('battle', None, self.game_map, snapshot_interval=1000)
+
+    def occupancy(self):
+        return {
+            point: {tank_id for tank_id, tank in self.state.simulation.tanks.items()
+                    if tank['is_alive'] and (tank['x'], tank['y']) == point}
+            for point in self.state.simulation.respawner.occupants
+        }
+
+    async def test_occupancy_follows_tanks(self):
+        rng = random.Random(5)
+        for player_id in range(4):
+            await self.state.create_tank(player_id)
+        for step in range(300):
+            now = step * 0.1
+            player_id = rng.randrange(4)
+            await self.state.move(player_id, rng.choice(['up', 'down', 'left', 'right']))
+            if rng.random() < 0.05 and self.state.simulation.tanks[player_id]['is_alive']:
+                tank = self.state.simulation.tanks[player_id]
+                tank['is_alive'] = False
+                tank['death_time'] = now
+                self.state.simulation.respawner.killed(player_id, tank)
+            await self.state.tick(now, 0.01)
+            self.assertEqual(self.state.simulation.respawner.occupants, self.occupancy(), step)
+        self.assertTrue(all(tank['is_alive'] or now - tank['death_time'] < 2.0 for tank in self.state.simulation.tanks.values()))
+
+    def test_waits_for_free_spawn(self):
+        spawn_points = [{'x': 96, 'y': 96}]
+        tanks = {
+            1: {'player_id': 1, 'x': 96, 'y': 96, 'direction': 'up', 'is_alive': True},
+            2: {'player_id': 2, 'x': 300, 'y': 300, 'direction': 'up', 'is_alive': False, 'death_time': 0.0},
+        }
+        respawner = Respawner(spawn_points, tanks)
+        self.assertEqual(respawner.respawn(tanks, 1.0), [])
+        self.assertEqual(respawner.respawn(tanks, 3.0), [])
+        tanks[1]['y'] = 101
+        respawner.moved(1, tanks[1], 96, 96)
+        self.assertEqual(respawner.respawn(tanks, 3.01), [2])
+        self.assertEqual((tanks[2]['x'], tanks[2]['y']), (96, 96))
@@ -1,3 +1,6 @@
 from django.urls import path
+from . import views
 
-urlpatterns = []
\ No newline at end of file
+urlpatterns = [
+    path('metrics/', views.metrics_view, name='metrics'),
+]
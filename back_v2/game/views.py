@@ -1,3 +1,13 @@
-from django.shortcuts import render
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
 
-# Create your views here.
+from game import metrics
+
+
+async def metrics_view(request):
+    # Метрики процесса, который ответил: у каждого воркера daphne свои бои.
+    # Асинхронный view выполняется в event loop боёв, поэтому render() не
+    # пересекается с движками, которые добавляют и удаляют бои
+    if settings.METRICS_ALLOWED_IPS is not None and request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
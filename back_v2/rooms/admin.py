@@ -1,3 +1,16 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import GameMap, Room
+
+
+@admin.register(GameMap)
+class GameMapAdmin(admin.ModelAdmin):
+    list_display = ('name', 'width', 'height', 'view_tiles', 'version')
+    readonly_fields = ('version',)
+
+
+@admin.register(Room)
+class RoomAdmin(admin.ModelAdmin):
+    list_display = ('id', 'map_name', 'mode', 'creator', 'is_active', 'end_time')
+    list_filter = ('is_active', 'mode')
+    raw_id_fields = ('creator', 'players')
@@ -0,0 +1,46 @@
+import logging
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Лобби опрашивает список комнат постоянно, поэтому готовые страницы лежат в
+# общем кэше. Создание, вход, выход и истечение комнат его сбрасывают
+# (rooms.signals и явные вызовы после bulk update), а TTL закрывает остальное:
+# смену ника создателя и т. п.
+ROOM_LIST_KEY = 'rooms:list'
+# Страниц и фильтров много, по одному ключу их не удалить: ключ страницы
+# включает поколение, а сброс списка просто начинает новое
+GENERATION_KEY = 'rooms:list:generation'
+
+
+def page_key(query):
+    generation = cache.get_or_set(GENERATION_KEY, 1, None)
+    return f"{ROOM_LIST_KEY}:{generation}:{query}"
+
+
+# Кэш — только ускорение: без Redis список строится из базы, а запись в
+# базу не должна падать после коммита из-за сброса кэша. Устаревшее ограничено
+# ROOM_LIST_CACHE_TTL
+def get_room_list(query=''):
+    try:
+        return cache.get(page_key(query))
+    except Exception as e:
+        logger.warning(f"Room list cache read failed: {e}")
+        return None
+
+
+def set_room_list(data, timeout, query=''):
+    try:
+        cache.set(page_key(query), data, timeout)
+    except Exception as e:
+        logger.warning(f"Room list cache write failed: {e}")
+
+
+def invalidate_room_list():
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        pass  # Поколения нет — значит, и страниц в кэше нет
+    except Exception as e:
+        logger.warning(f"Room list cache invalidation failed: {e}")
@@ -0,0 +1,24 @@
+# Generated by Django 5.2 on 2026-10-18 09:05
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rooms', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='broadcast_rate',
+            field=models.PositiveSmallIntegerField(default=100, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(120)]),
+        ),
+        migrations.AddField(
+            model_name='room',
+            name='tick_rate',
+            field=models.PositiveSmallIntegerField(default=100, validators=[django.core.validators.MinValueValidator(10), django.core.validators.MaxValueValidator(120)]),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 09:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rooms', '0002_room_tick_rates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gamemap',
+            name='view_tiles',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+    ]
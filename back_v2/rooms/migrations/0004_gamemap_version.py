@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rooms', '0003_gamemap_view_tiles'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gamemap',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
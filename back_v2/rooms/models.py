@@ -1,5 +1,7 @@
 import uuid
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.db.models import Count, Q
 from authenticator.models import CustomUser
 from django.utils import timezone
 from datetime import timedelta
@@ -13,10 +15,32 @@ class GameMap(models.Model):
     width = models.IntegerField(default=800)  # Ширина карты (пиксели или клетки)
     height = models.IntegerField(default=600)  # Высота карты
     obstacles = models.TextField()  # Список препятствий
+    view_tiles = models.PositiveSmallIntegerField(
+        null=True, blank=True
+    )  # Игрок видит окно ±view_tiles клеток вокруг танка; пусто — всю карту
+    version = models.PositiveIntegerField(default=1, editable=False)  # Ключ кэша скомпилированных карт
+
+    def save(self, *args, **kwargs):
+        if self.pk:
+            self.version += 1
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name
 
+class RoomQuerySet(models.QuerySet):
+    def listed(self, now=None):
+        # Активные комнаты для лобби: создатель и карта — join'ом, игроки — подсчётом.
+        # Истекшие, но ещё не деактивированные чистильщиком, не показываем
+        now = now or timezone.now()
+        return (
+            self.filter(Q(end_time__isnull=True) | Q(end_time__gte=now), is_active=True)
+            .select_related('creator', 'map_name')
+            .annotate(player_count=Count('players'))
+            .order_by('id')
+        )
+
+
 class Room(models.Model):
     creator = models.ForeignKey(CustomUser, related_name='created_rooms', on_delete=models.CASCADE)
     mode = models.CharField(max_length=2, choices=GameMode, default=GameMode.DEATHMATCH)
@@ -27,6 +51,24 @@ class Room(models.Model):
     end_time = models.DateTimeField(null=True, blank=True)
     battle_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
     players = models.ManyToManyField(CustomUser, related_name='joined_rooms', blank=True)
+    tick_rate = models.PositiveSmallIntegerField(
+        default=100, validators=[MinValueValidator(10), MaxValueValidator(120)]
+    )  # Тиков симуляции в секунду
+    broadcast_rate = models.PositiveSmallIntegerField(
+        default=100, validators=[MinValueValidator(1), MaxValueValidator(120)]
+    )  # Кадров состояния клиентам в секунду, не больше tick_rate
+
+    objects = RoomQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Чистильщик истекших комнат: is_active=True AND end_time < now
+            models.Index(fields=['is_active', 'end_time'], name='room_active_end_time_idx'),
+            # Страницы списка по курсору: is_active=True [AND фильтр] AND id > курсор ORDER BY id
+            models.Index(fields=['is_active', 'id'], name='room_active_id_idx'),
+            models.Index(fields=['is_active', 'mode', 'id'], name='room_active_mode_id_idx'),
+            models.Index(fields=['is_active', 'map_name', 'id'], name='room_active_map_id_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.end_time:
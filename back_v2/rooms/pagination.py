@@ -0,0 +1,31 @@
+from urllib.parse import parse_qs, urlsplit
+
+from rest_framework.pagination import CursorPagination
+from rest_framework.utils.urls import replace_query_param
+
+
+class RoomCursorPagination(CursorPagination):
+    # Keyset по id: страница — один запрос WHERE id > курсор LIMIT n + 1,
+    # сколько бы комнат ни было до неё; COUNT не считаем
+    ordering = 'id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def get_cursors(self):
+        # Только курсоры соседних страниц: полные ссылки зависят от Host
+        # запроса и в общий кэш не идут
+        return {'next': self.link_cursor(self.get_next_link()), 'previous': self.link_cursor(self.get_previous_link())}
+
+    def link_cursor(self, link):
+        if link is None:
+            return None
+        return parse_qs(urlsplit(link).query)[self.cursor_query_param][0]
+
+    @classmethod
+    def build_links(cls, request, cursors):
+        url = request.build_absolute_uri()
+        return {
+            name: replace_query_param(url, cls.cursor_query_param, cursor) if cursor else None
+            for name, cursor in cursors.items()
+        }
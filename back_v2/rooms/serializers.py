@@ -1,6 +1,7 @@
 from django.db import transaction
+from drf_yasg.utils import swagger_serializer_method
 from rest_framework import serializers
-from .models import Room
+from .models import GameMode, Room
 from authenticator.serializers import UserSerializer
 from rooms.models import GameMap
 
@@ -8,32 +9,53 @@ class RoomSerializer(serializers.ModelSerializer):
     creator = UserSerializer(read_only=True)
     map_name = serializers.SlugRelatedField(slug_field='name', queryset=GameMap.objects.all())
     current_players = UserSerializer(many=True, read_only=True)
-    current_player_count = serializers.IntegerField(source='players.count', read_only=True)
+    current_player_count = serializers.SerializerMethodField()
 
     class Meta:
         model = Room
         fields = (
             'id', 'battle_id', 'creator', 'map_name', 'mode', 'max_players',
-            'current_player_count', 'current_players', 'is_active', 'created_at', 'end_time'
+            'current_player_count', 'current_players', 'is_active', 'created_at', 'end_time',
+            'tick_rate', 'broadcast_rate'
         )
         read_only_fields = ('id', 'battle_id', 'creator', 'current_players', 'is_active', 'created_at', 'end_time')
 
+    @swagger_serializer_method(serializer_or_field=serializers.IntegerField())
+    def get_current_player_count(self, room):
+        # В списке число игроков уже посчитано аннотацией (Room.objects.listed)
+        if hasattr(room, 'player_count'):
+            return room.player_count
+        return room.players.count()
+
+class RoomPageSerializer(serializers.Serializer):
+    # Только для схемы: ответ RoomCursorPagination
+    next = serializers.URLField(allow_null=True)
+    previous = serializers.URLField(allow_null=True)
+    results = RoomSerializer(many=True)
+
+class RoomListFilterSerializer(serializers.Serializer):
+    mode = serializers.ChoiceField(choices=GameMode.choices, required=False)
+    map = serializers.CharField(required=False, help_text='Название карты')
+    free = serializers.BooleanField(required=False, default=False, help_text='Только комнаты со свободными местами')
+
 class RoomCreateSerializer(serializers.ModelSerializer):
     map_name = serializers.SlugRelatedField(slug_field='name', queryset=GameMap.objects.all())
 
     class Meta:
         model = Room
-        fields = ('map_name', 'max_players', 'mode')
+        fields = ('map_name', 'max_players', 'mode', 'tick_rate', 'broadcast_rate')
+
+    def validate(self, data):
+        tick_rate = data.get('tick_rate', Room._meta.get_field('tick_rate').default)
+        broadcast_rate = data.get('broadcast_rate', Room._meta.get_field('broadcast_rate').default)
+        if broadcast_rate > tick_rate:
+            raise serializers.ValidationError({'broadcast_rate': 'Cannot exceed tick_rate'})
+        return data
 
     def create(self, validated_data):
         user = self.context['request'].user
         with transaction.atomic():
-            room = Room.objects.create(
-                creator=user,
-                map_name=validated_data['map_name'],
-                max_players=validated_data['max_players'],
-                mode=validated_data['mode']
-            )
+            room = Room.objects.create(creator=user, **validated_data)
             room.players.add(user)
         return room
 
@@ -0,0 +1,17 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from rooms.cache import invalidate_room_list
+from rooms.models import GameMap, Room
+
+
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+@receiver(post_save, sender=GameMap)
+@receiver(post_delete, sender=GameMap)
+@receiver(m2m_changed, sender=Room.players.through)
+def invalidate_rooms(sender, **kwargs):
+    # После коммита: иначе параллельный GET успеет закэшировать список без
+    # изменения, например без комнаты из транзакции RoomCreate, на весь TTL
+    transaction.on_commit(invalidate_room_list)
@@ -1,3 +1,8 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework.test import APITestCase
 from rest_framework import status
@@ -6,8 +11,11 @@ from datetime import timedelta
 from authenticator.models import CustomUser
 from rooms.models import Room, GameMap
 
+
+@override_settings(CACHES=settings.LOCAL_CACHES)
 class RoomTests(APITestCase):
     def setUp(self):
+        cache.clear()
         self.user = CustomUser.objects.create_user(
             username='testuser',
             password='testpass123',
@@ -45,16 +53,19 @@ class RoomTests(APITestCase):
     def test_list_active_rooms(self):
         response = self.client.get(self.room_list_url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertIsInstance(response.data, list)
-        self.assertTrue(any(room['id'] == self.room.id for room in response.data))
+        self.assertIsInstance(response.data['results'], list)
+        self.assertIsNone(response.data['next'])
+        self.assertTrue(any(room['id'] == self.room.id for room in response.data['results']))
 
-    def test_deactivate_expired_rooms(self):
+    def test_expired_rooms_are_not_listed(self):
+        # Деактивирует их game.sweeper, список только не показывает
         self.room.end_time = timezone.now() - timedelta(minutes=1)
         self.room.save()
         response = self.client.get(self.room_list_url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [])
         self.room.refresh_from_db()
-        self.assertFalse(self.room.is_active)
+        self.assertTrue(self.room.is_active)
 
     def test_create_room_authenticated(self):
         data = {
@@ -66,6 +77,16 @@ class RoomTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(response.data['creator']['username'], self.user.username)
 
+    def test_create_room_with_rates(self):
+        data = {"map_name": self.map.name, "max_players": 4, "mode": "DM", "tick_rate": 60, "broadcast_rate": 20}
+        response = self.client.post(self.room_create_url, data, **self.auth_header)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((response.data['tick_rate'], response.data['broadcast_rate']), (60, 20))
+
+        data['broadcast_rate'] = 90
+        response = self.client.post(self.room_create_url, data, **self.auth_header)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_create_room_unauthenticated(self):
         data = {
             "map_name": self.map.name,
@@ -108,3 +129,112 @@ class RoomTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['message'], 'Left room')
         self.assertEqual(self.user.joined_rooms.filter(is_active=True).count(), 0)
+
+    def test_list_query_count_does_not_grow_with_rooms(self):
+        for i in range(5):
+            user = CustomUser.objects.create_user(username=f'player{i}', password='x', nickname=f'Player{i}')
+            room = Room.objects.create(creator=user, map_name=self.map, max_players=4)
+            room.players.add(user, self.user)
+        cache.clear()
+        with self.assertNumQueries(1):
+            response = self.client.get(self.room_list_url)
+        self.assertEqual(len(response.data['results']), 6)
+        self.assertEqual(response.data['results'][-1]['current_player_count'], 2)
+        self.assertEqual(response.data['results'][-1]['creator']['username'], 'player4')
+
+    def test_list_is_cached_until_rooms_change(self):
+        self.client.get(self.room_list_url)
+        with self.assertNumQueries(0):
+            self.client.get(self.room_list_url)
+
+        another = CustomUser.objects.create_user(username='another', password='x', nickname='Another')
+        # Кэш сбрасывается после коммита, а не внутри транзакции
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.room.players.add(another)
+            with self.assertNumQueries(0):
+                self.client.get(self.room_list_url)
+        self.assertTrue(callbacks)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.room_list_url)
+        self.assertTrue(queries.captured_queries)
+        room = next(room for room in response.data['results'] if room['id'] == self.room.id)
+        self.assertEqual(room['current_player_count'], 2)
+
+    def test_list_pages_by_cursor_in_one_query_each(self):
+        for i in range(11):
+            user = CustomUser.objects.create_user(username=f'owner{i}', password='x', nickname=f'Owner{i}')
+            Room.objects.create(creator=user, map_name=self.map, max_players=4)
+        cache.clear()
+        url, seen = f'{self.room_list_url}?page_size=5', []
+        while url:
+            with self.assertNumQueries(1):
+                response = self.client.get(url)
+            self.assertLessEqual(len(response.data['results']), 5)
+            seen += [room['id'] for room in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(seen, sorted(Room.objects.values_list('id', flat=True)))
+
+        # Со всеми фильтрами страница по-прежнему один запрос
+        with self.assertNumQueries(1):
+            response = self.client.get(self.room_list_url, {'mode': 'DM', 'map': 'TestMap', 'free': 'true', 'page_size': 5})
+        self.assertEqual(len(response.data['results']), 5)
+
+    def test_list_filters(self):
+        other_map = GameMap.objects.create(name='Other', width=800, height=600, obstacles='')
+        team = Room.objects.create(creator=self.user, map_name=other_map, mode='TB', max_players=4)
+        full = Room.objects.create(creator=self.user, map_name=self.map, max_players=1)
+        full.players.add(self.user)
+
+        def ids(**params):
+            response = self.client.get(self.room_list_url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return [room['id'] for room in response.data['results']]
+
+        self.assertEqual(ids(mode='TB'), [team.id])
+        self.assertEqual(ids(map='TestMap'), [self.room.id, full.id])
+        self.assertEqual(ids(free='true'), [self.room.id, team.id])
+        self.assertEqual(ids(mode='DM', free='true'), [self.room.id])
+        response = self.client.get(self.room_list_url, {'mode': 'XX'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_cache_is_per_query_and_reset_together(self):
+        self.client.get(self.room_list_url, {'mode': 'DM'})
+        self.client.get(self.room_list_url, {'mode': 'TB'})
+        with self.assertNumQueries(0):
+            self.assertEqual(len(self.client.get(self.room_list_url, {'mode': 'DM'}).data['results']), 1)
+            self.assertEqual(self.client.get(self.room_list_url, {'mode': 'TB'}).data['results'], [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Room.objects.create(creator=self.user, map_name=self.map, mode='TB')
+        response = self.client.get(self.room_list_url, {'mode': 'TB'})
+        self.assertEqual(len(response.data['results']), 1)
+
+    @override_settings(ALLOWED_HOSTS=['testserver', 'lobby.example'])
+    def test_cached_page_links_follow_request_host(self):
+        Room.objects.create(creator=self.user, map_name=self.map)
+        first = self.client.get(self.room_list_url, {'page_size': 1})
+        self.assertTrue(first.data['next'].startswith('http://testserver/api/rooms/?'))
+        self.assertIsNone(first.data['previous'])
+        with self.assertNumQueries(0):
+            other = self.client.get(self.room_list_url, {'page_size': 1}, HTTP_HOST='lobby.example')
+        self.assertTrue(other.data['next'].startswith('http://lobby.example/api/rooms/?'))
+
+        second = self.client.get(other.data['next'], HTTP_HOST='lobby.example')
+        self.assertIsNone(second.data['next'])
+        self.assertTrue(second.data['previous'].startswith('http://lobby.example/api/rooms/?'))
+        back = self.client.get(second.data['previous'], HTTP_HOST='lobby.example')
+        self.assertEqual(back.data['results'], first.data['results'])
+
+    @override_settings(CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://127.0.0.1:1/1'}
+    })
+    def test_rooms_work_without_cache(self):
+        # Redis недоступен: запись уже в базе, ответ не должен стать 500
+        data = {"map_name": self.map.name, "max_players": 4, "mode": "DM"}
+        with self.assertLogs('rooms.cache', 'WARNING'), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.room_create_url, data, **self.auth_header)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        with self.assertLogs('rooms.cache', 'WARNING'):
+            response = self.client.get(self.room_list_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 2)
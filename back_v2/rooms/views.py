@@ -1,3 +1,8 @@
+import math
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.db.models import F
 from django.utils import timezone
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -5,30 +10,60 @@ from rest_framework import status
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
+from .cache import get_room_list, set_room_list
 from .models import Room
-from .serializers import RoomSerializer, RoomCreateSerializer, RoomJoinSerializer
+from .pagination import RoomCursorPagination
+from .serializers import (
+    RoomSerializer, RoomCreateSerializer, RoomJoinSerializer, RoomListFilterSerializer, RoomPageSerializer
+)
 
 class RoomList(APIView):
     permission_classes = [AllowAny]
+    # Параметры, от которых зависит ответ; по ним же ключ страницы в кэше
+    list_params = ('mode', 'map', 'free', 'cursor', 'page_size')
 
     @swagger_auto_schema(
         operation_summary="Получить список активных комнат",
-        operation_description="Возвращает список всех активных игровых комнат. Комнаты, время жизни которых истекло, автоматически деактивируются.",
-        responses={200: RoomSerializer(many=True)}
+        operation_description="Возвращает страницу активных игровых комнат по курсору (поля next и previous). Комнаты, время жизни которых истекло, в список не попадают.",
+        query_serializer=RoomListFilterSerializer,
+        manual_parameters=[
+            openapi.Parameter('cursor', openapi.IN_QUERY, type=openapi.TYPE_STRING, description='Курсор из next или previous'),
+            openapi.Parameter('page_size', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, description='Комнат на странице, до 100'),
+        ],
+        responses={200: RoomPageSerializer()}
     )
     def get(self, request):
-        now = timezone.now()
-        active_rooms = Room.objects.filter(is_active=True)
+        filters = RoomListFilterSerializer(data=request.query_params)
+        if not filters.is_valid():
+            return Response({'error': filters.errors}, status=status.HTTP_400_BAD_REQUEST)
+        query = urlencode(sorted(
+            (key, value) for key, value in request.query_params.items() if key in self.list_params
+        ))
+        data = get_room_list(query)
+        if data is None:
+            data, timeout = self.build(request, filters.validated_data)
+            set_room_list(data, timeout, query)
+        links = RoomCursorPagination.build_links(request, {'next': data['next'], 'previous': data['previous']})
+        return Response(dict(links, results=data['results']), status=status.HTTP_200_OK)
 
-        # Проверка и деактивация истекших комнат
-        expired_rooms = active_rooms.filter(end_time__lt=now)
-        if expired_rooms.exists():
-            expired_rooms.update(is_active=False)
-
-        # Повторный запрос активных после деактивации
-        rooms = Room.objects.filter(is_active=True)
-        serializer = RoomSerializer(rooms, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+    def build(self, request, filters):
+        # Один запрос на страницу при любом числе комнат; истекшие деактивирует game.sweeper
+        now = timezone.now()
+        rooms = Room.objects.listed(now)
+        if 'mode' in filters:
+            rooms = rooms.filter(mode=filters['mode'])
+        if 'map' in filters:
+            rooms = rooms.filter(map_name__name=filters['map'])
+        if filters['free']:
+            rooms = rooms.filter(player_count__lt=F('max_players'))
+        paginator = RoomCursorPagination()
+        page = paginator.paginate_queryset(rooms, request, view=self)
+        # Кэш не должен пережить конец ближайшей комнаты, иначе она повисит в лобби
+        timeout = settings.ROOM_LIST_CACHE_TTL
+        end_times = [room.end_time for room in page if room.end_time]
+        if end_times:
+            timeout = max(1, min(timeout, math.ceil((min(end_times) - now).total_seconds())))
+        return dict(paginator.get_cursors(), results=RoomSerializer(page, many=True).data), timeout
 
 class RoomCreate(APIView):
     permission_classes = [IsAuthenticated]
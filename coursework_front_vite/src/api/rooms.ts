@@ -1,16 +1,16 @@
 import { setAuthToken } from './auth';
-import { Room } from '../types/room';
+import { Room, RoomFilters, RoomPage } from '../types/room';
 import { api } from "./index.ts";
 
 // Убедимся, что токен используется для всех запросов
 setAuthToken(localStorage.getItem('access_token'));
 
-// Получение списка комнат
-export const getRooms = async (): Promise<Room[] | null> => {
+// Страница списка: url — '/rooms/' или next/previous предыдущего ответа
+export const getRoomPage = async (url: string, filters: RoomFilters = {}): Promise<RoomPage | null> => {
     try {
-        const response = await api.get<Room[]>('/rooms/');
-        console.log('Rooms: ', response.data.length);
-        console.log('Room id: ', response.data.map(room => room.id));
+        const response = await api.get<RoomPage>(url, { params: filters });
+        console.log('Rooms: ', response.data.results.length);
+        console.log('Room id: ', response.data.results.map(room => room.id));
         return response.data;
     } catch (error) {
         console.log("Get room error", error);
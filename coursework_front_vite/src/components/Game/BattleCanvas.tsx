@@ -45,6 +45,20 @@ type GameState = {
   time_left: number | null;
 };
 
+// Кадр с сервера: ключевой (всё состояние) или дельта от тика base
+type StateFrame = {
+  tick: number;
+  base?: number;
+  keyframe?: boolean;
+  battle_id?: string;
+  time_left?: number | null;
+  tanks?: Tank[];
+  bullets?: Bullet[];
+  removed_tanks?: number[];
+  removed_bullets?: string[];
+  map?: GameMap;
+};
+
 const loadImage = (src: string): Promise<HTMLImageElement> => {
   return new Promise((resolve, reject) => {
     const img = new Image();
@@ -78,6 +92,9 @@ const BattleCanvas: React.FC = () => {
     const [explosionFrames, setExplosionFrames] = useState<HTMLImageElement[]>([]);
 
     const gameStateRef = useRef<GameState | null>(null);
+    const lastTick = useRef<number | null>(null);
+    const tanksById = useRef<Map<number, Tank>>(new Map());
+    const bulletsById = useRef<Map<string, Bullet>>(new Map());
     const mapRef = useRef<GameMap | null>(null);
     const prevBullets = useRef<Bullet[]>([]);
     const prevTanksState = useRef<Record<number, { is_alive: boolean }>>({});
@@ -141,7 +158,34 @@ const BattleCanvas: React.FC = () => {
             ws.current.onmessage = (event) => {
                 const msg = JSON.parse(event.data);
                 if (msg.type === 'state') {
-                    const newState = msg.data as GameState;
+                    const frame = msg.data as StateFrame;
+
+                    if (frame.keyframe) {
+                        tanksById.current = new Map();
+                        bulletsById.current = new Map();
+                    } else if (lastTick.current === null || frame.tick <= lastTick.current) {
+                        // Ждём ключевой кадр или кадр уже учтён
+                        return;
+                    } else if ((frame.base ?? 0) > lastTick.current) {
+                        // Пропустили кадры — просим полное состояние
+                        lastTick.current = null;
+                        ws.current?.send(JSON.stringify({action: 'resync'}));
+                        return;
+                    }
+                    lastTick.current = frame.tick;
+
+                    frame.tanks?.forEach((tank) => tanksById.current.set(tank.player_id, tank));
+                    frame.removed_tanks?.forEach((id) => tanksById.current.delete(id));
+                    frame.bullets?.forEach((bullet) => bulletsById.current.set(bullet.id, bullet));
+                    frame.removed_bullets?.forEach((id) => bulletsById.current.delete(id));
+
+                    const newState: GameState = {
+                        tanks: Array.from(tanksById.current.values()),
+                        bullets: Array.from(bulletsById.current.values()),
+                        map: frame.map,
+                        battle_id: frame.battle_id ?? gameStateRef.current?.battle_id ?? '',
+                        time_left: frame.time_left !== undefined ? frame.time_left : gameStateRef.current?.time_left ?? null,
+                    };
 
                     // Обновляем карту, если она пришла
                     if (newState.map) {
@@ -206,6 +250,16 @@ const BattleCanvas: React.FC = () => {
                 } else if (msg.type === 'event') {
                     if (msg.data.event === 'game_over') {
                         alert(`Game Over: ${msg.data.reason}`);
+                    } else if (msg.data.event === 'tiles') {
+                        // Разрушенные клетки за тик; без карты ждём её в ключевом кадре
+                        if (mapRef.current) {
+                            const obstacles = mapRef.current.obstacles.split('');
+                            (msg.data.tiles as { index: number; tile: string }[]).forEach(({index, tile}) => {
+                                obstacles[index] = tile;
+                            });
+                            mapRef.current = {...mapRef.current, obstacles: obstacles.join('')};
+                            shouldRender.current = true;
+                        }
                     } else if (msg.type === 'error') {
                         console.error(msg.data.message);
                         alert(`Error: ${msg.data.message}`);
@@ -1,8 +1,8 @@
 import React, { useState, useEffect } from 'react';
 import './Hangar.css';
 import { logout, userInfo} from '../../api/auth';
-import {getRooms, createRoom, joinRoom, CreateRoomData} from '../../api/rooms';
-import { Room } from '../../types/room';
+import {getRoomPage, createRoom, joinRoom, CreateRoomData} from '../../api/rooms';
+import { Room, RoomPage } from '../../types/room';
 import { User } from '../../types/auth';
 import { useNavigate } from 'react-router-dom';
 import RoomsList from "./RoomsList.tsx";
@@ -10,6 +10,9 @@ import RoomsList from "./RoomsList.tsx";
 const Hangar: React.FC = () => {
   const [user, setUser] = useState<User | null>(null);
   const [rooms, setRooms] = useState<Room[]>([]);
+  // Текущая страница списка и ссылки на соседние
+  const [pageUrl, setPageUrl] = useState('/rooms/');
+  const [links, setLinks] = useState<Pick<RoomPage, 'next' | 'previous'>>({next: null, previous: null});
   const [error, setError] = useState<string | null>(null);
   const [isModalOpen, setIsModalOpen] = useState(false);
   const [newRoom, setNewRoom] = useState<CreateRoomData>({
@@ -19,9 +22,9 @@ const Hangar: React.FC = () => {
   });
   const navigate = useNavigate();
 
-  // Загружаем данные пользователя и список комнат при монтировании
+  // Загружаем данные пользователя при монтировании
   useEffect(() => {
-    const fetchData = async () => {
+    const fetchUser = async () => {
       try {
         const user = await userInfo();
         if (user) {
@@ -33,26 +36,27 @@ const Hangar: React.FC = () => {
         console.error('Ошибка при получении пользователя:', err);
         navigate('/login');
       }
-
-      try {
-        const roomsData = await getRooms();
-        setRooms(roomsData || []);
-      } catch (err) {
-        setError((err as Error).message);
-      }
     };
 
-    fetchData();
-    const interval = setInterval(() => {
-      getRooms().then((roomsData) => {
-        setRooms(roomsData || []);
+    fetchUser();
+  }, [navigate]);
+
+  // Загружаем текущую страницу комнат и обновляем её каждые 5 секунд
+  useEffect(() => {
+    const fetchRooms = () => {
+      getRoomPage(pageUrl).then((page) => {
+        setRooms(page ? page.results : []);
+        setLinks({next: page?.next ?? null, previous: page?.previous ?? null});
       }).catch((err) => {
         setError((err as Error).message);
       });
-    }, 5000);
+    };
+
+    fetchRooms();
+    const interval = setInterval(fetchRooms, 5000);
 
     return () => clearInterval(interval);
-  }, [navigate]);
+  }, [pageUrl]);
 
 
 
@@ -120,6 +124,23 @@ const Hangar: React.FC = () => {
           <div className="rooms-list">
             {error && <p className="error">{error}</p>}
             <RoomsList rooms={rooms} onJoin={handleJoinRoom} />
+            {/* Переключение страниц */}
+            <div className="pagination">
+              <button
+                  className="control-button"
+                  onClick={() => links.previous && setPageUrl(links.previous)}
+                  disabled={!links.previous}
+              >
+                Назад
+              </button>
+              <button
+                  className="control-button"
+                  onClick={() => links.next && setPageUrl(links.next)}
+                  disabled={!links.next}
+              >
+                Вперёд
+              </button>
+            </div>
           </div>
 
           {/* Модальное окно для создания комнаты */}
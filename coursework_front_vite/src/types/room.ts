@@ -12,4 +12,17 @@ export interface Room {
     is_active: boolean;
     created_at: string;
     end_time: string | null;
-}
\ No newline at end of file
+}
+// Страница GET /rooms/: next и previous — полные URL соседних страниц
+export interface RoomPage {
+    next: string | null;
+    previous: string | null;
+    results: Room[];
+}
+
+export interface RoomFilters {
+    mode?: 'DM' | 'TB';
+    map?: string;
+    free?: boolean;
+    page_size?: number;
+}